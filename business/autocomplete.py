@@ -0,0 +1,302 @@
+"""
+Search-as-you-type suggestions.
+
+Suggestions are item titles, category names and the brand options of the
+brand attributes. Each suggestion is stored once in ``entries`` and reachable
+through one sorted key per word it contains (``"iphone 13\\0t:apple iphone 13"``
+for the second word of "Apple iPhone 13"), so a prefix lookup is two bisects
+over a flat list of strings. Popularity decides the order: the number of
+active items behind a suggestion, plus their views for titles.
+
+The results of every prefix up to ``SHORT_PREFIX`` characters, the widest
+key ranges, are computed when the index is built and patched when an item
+changes; longer prefixes are looked up and memoized.
+
+Like the facet index, every process keeps its own copy, patches it in place
+when an item changes and rebuilds it when the generation number in the cache
+says another process changed it, or at the latest once the copy is
+``AUTOCOMPLETE_INDEX_MAX_AGE`` seconds old, since the generation only
+reaches other processes through a shared cache. Rebuilds run on a
+background thread; requests keep using the previous copy meanwhile.
+"""
+import heapq
+import logging
+import math
+import threading
+import time
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from .search import tokenize
+
+logger = logging.getLogger(__name__)
+
+GENERATION_KEY = 'autocomplete:generation'
+MAX_AGE = getattr(settings, 'AUTOCOMPLETE_INDEX_MAX_AGE', 300)
+
+# Only the first few words of a title are reachable; keeps the key list small
+MAX_WORDS = 6
+
+# Results are memoized per prefix; short prefixes match large key ranges
+MEMO_SIZE = 2048
+DEFAULT_LIMIT = 8
+
+# Prefixes up to this length are precomputed, each with this many entries
+# (spares for deduplication and for entries that drop out between builds)
+SHORT_PREFIX = 3
+SHORT_SIZE = DEFAULT_LIMIT * 3
+
+TITLE, CATEGORY, BRAND = 't', 'c', 'b'
+KINDS = {TITLE: 'item', CATEGORY: 'category', BRAND: 'brand'}
+
+
+def normalize(text):
+    return ' '.join(tokenize(text))
+
+
+def _keys(entry_key, phrase):
+    words = phrase.split()[:MAX_WORDS]
+    return {f"{' '.join(words[i:])}\0{entry_key}" for i in range(len(words))}
+
+
+def _title_weight(views):
+    return 1 + math.log1p(views or 0)
+
+
+class AutocompleteIndex:
+    def __init__(self):
+        self.generation = None
+        self.built_at = 0
+        self.entries = {}
+        self.keys = []
+        self.short = {}
+        self._capped = set()
+        self._memo = {}
+        self._lock = threading.Lock()
+        self._building = False
+
+    def _build(self, generation):
+        from .models import Item, Category, Attribute, BRAND_ATTRIBUTE_NAMES
+
+        entries = {}
+        for category_id, name in Category.objects.values_list('id', 'name'):
+            # [text, weight, number of active items]; categories and brands
+            # stay even without items, titles go with their last item
+            entries[f'{CATEGORY}:{category_id}'] = [name, 0.0, 0]
+        for options in Attribute.objects.filter(name__in=BRAND_ATTRIBUTE_NAMES).values_list('options', flat=True):
+            for option in (options or '').split(','):
+                phrase = normalize(option)
+                if phrase:
+                    entries.setdefault(f'{BRAND}:{phrase}', [option.strip(), 0.0, 0])
+
+        rows = Item.objects.filter(status='active').values_list('title', 'views', 'brand', 'category_obj_id')
+        for title, views, brand, category_id in rows.iterator(chunk_size=2000):
+            self._add(entries, title, views, brand, category_id, 1)
+
+        keys = []
+        short = {}
+        capped = set()
+        # Most popular first, so each short prefix keeps its best entries
+        for entry_key, entry in sorted(entries.items(), key=lambda pair: (-pair[1][1], pair[1][0])):
+            for key in _keys(entry_key, normalize(entry[0])):
+                keys.append(key)
+                words = key.partition('\0')[0]
+                for end in range(1, min(SHORT_PREFIX, len(words)) + 1):
+                    ranked = short.setdefault(words[:end], [])
+                    if entry_key in ranked:
+                        continue
+                    if len(ranked) < SHORT_SIZE:
+                        ranked.append(entry_key)
+                    else:
+                        capped.add(words[:end])
+        keys.sort()
+
+        with self._lock:
+            self.generation = generation
+            self.built_at = time.monotonic()
+            self.entries = entries
+            self.keys = keys
+            self.short = short
+            self._capped = capped
+            self._memo = {}
+
+    def _refresh(self, generation):
+        """Rebuild on a background thread unless a rebuild is running."""
+        with self._lock:
+            if self._building:
+                return
+            self._building = True
+
+        def run():
+            try:
+                self._build(generation)
+            except Exception:
+                logger.exception('Rebuilding the autocomplete index failed')
+            finally:
+                self._building = False
+                connection.close()
+
+        threading.Thread(target=run, name='autocomplete-build', daemon=True).start()
+
+    def _forget(self, entry_key, phrase):
+        """
+        Re-rank ``entry_key`` in the precomputed short prefixes that reach it
+        and drop the memoized results of the longer ones.
+        """
+        entry = self.entries.get(entry_key)
+        rank = lambda key: (-self.entries[key][1], self.entries[key][0])
+        for key in _keys(entry_key, phrase):
+            words = key.partition('\0')[0]
+            for end in range(1, min(SHORT_PREFIX, len(words)) + 1):
+                ranked = self.short.setdefault(words[:end], [])
+                if entry_key in ranked:
+                    ranked.remove(entry_key)
+                if entry is not None:
+                    ranked.append(entry_key)
+                    ranked.sort(key=rank)
+                    del ranked[SHORT_SIZE:]
+            for end in range(SHORT_PREFIX + 1, len(words) + 1):
+                self._memo.pop(words[:end], None)
+
+    def _add(self, entries, title, views, brand, category_id, sign, keys=None):
+        """
+        Add (``sign=1``) or take away (``sign=-1``) one active item's share.
+        ``keys`` is passed when patching the live index.
+        """
+        phrase = normalize(title)
+        if phrase:
+            entry_key = f'{TITLE}:{phrase}'
+            entry = entries.get(entry_key)
+            if entry is None and sign > 0:
+                entry = entries[entry_key] = [title.strip(), 0.0, 0]
+                if keys is not None:
+                    for key in _keys(entry_key, phrase):
+                        insort(keys, key)
+            if entry is not None:
+                entry[1] += sign * _title_weight(views)
+                entry[2] += sign
+                if entry[2] <= 0:
+                    del entries[entry_key]
+                    if keys is not None:
+                        for key in _keys(entry_key, phrase):
+                            position = bisect_left(keys, key)
+                            if position < len(keys) and keys[position] == key:
+                                del keys[position]
+            if keys is not None:
+                self._forget(entry_key, phrase)
+
+        for entry_key in (f'{BRAND}:{normalize(brand)}', f'{CATEGORY}:{category_id}'):
+            entry = entries.get(entry_key)
+            if entry is not None:
+                entry[1] += sign
+                entry[2] += sign
+                if keys is not None:
+                    self._forget(entry_key, normalize(entry[0]))
+
+    def _current(self):
+        cache.add(GENERATION_KEY, 1, None)
+        generation = cache.get(GENERATION_KEY, 1)
+        if generation != self.generation or time.monotonic() - self.built_at > MAX_AGE:
+            self._refresh(generation)
+
+    def _bump(self, patched):
+        cache.add(GENERATION_KEY, 0, None)
+        try:
+            generation = cache.incr(GENERATION_KEY)
+        except ValueError:
+            generation = None
+        with self._lock:
+            # Keep the local copy only if no other process changed it meanwhile
+            if patched and generation is not None and self.generation is not None \
+                    and generation == self.generation + 1:
+                self.generation = generation
+            else:
+                self.generation = None
+
+    def update_item(self, item, previous=None):
+        """
+        Re-count ``item`` after it was saved. ``previous`` holds the stored
+        values it was loaded with, or is None for a new item.
+        """
+        patched = self.generation is not None
+        if patched:
+            with self._lock:
+                if previous and previous.get('status') == 'active':
+                    self._add(
+                        self.entries, previous.get('title'), previous.get('views'),
+                        previous.get('brand'), previous.get('category_obj_id'), -1, self.keys,
+                    )
+                if item.status == 'active':
+                    self._add(
+                        self.entries, item.title, item.views, item.brand, item.category_obj_id, 1, self.keys,
+                    )
+        self._bump(patched)
+
+    def remove_item(self, item):
+        patched = self.generation is not None
+        if patched and item.status == 'active':
+            with self._lock:
+                self._add(self.entries, item.title, item.views, item.brand, item.category_obj_id, -1, self.keys)
+        self._bump(patched)
+
+    def invalidate(self):
+        """Drop every copy; used when categories or brand options change."""
+        self._bump(False)
+
+    def _lookup(self, prefix, limit):
+        entries = self.entries
+        if len(prefix) <= SHORT_PREFIX and limit <= DEFAULT_LIMIT:
+            ranked = self.short.get(prefix, [])
+            # Unless removals thinned out a list that was cut off at build time
+            if len(ranked) >= limit * 2 or prefix not in self._capped:
+                return self._suggestions(ranked, limit)
+
+        suggestions = self._memo.get(prefix, {}).get(limit)
+        if suggestions is not None:
+            return suggestions
+
+        keys = self.keys
+        start = bisect_left(keys, prefix)
+        end = bisect_left(keys, prefix + '\U0010ffff', start)
+        matched = {key.partition('\0')[2] for key in keys[start:end]}
+        # A title and a brand can read the same; ask for spares to dedupe
+        best = heapq.nsmallest(
+            limit * 2, matched, key=lambda entry_key: (-entries[entry_key][1], entries[entry_key][0])
+        )
+        suggestions = self._suggestions(best, limit)
+        if len(self._memo) >= MEMO_SIZE:
+            self._memo = {}
+        self._memo.setdefault(prefix, {})[limit] = suggestions
+        return suggestions
+
+    def _suggestions(self, best, limit):
+        entries = self.entries
+        suggestions = []
+        seen = set()
+        for entry_key in best:
+            text = entries[entry_key][0]
+            if text.lower() in seen or len(suggestions) == limit:
+                continue
+            seen.add(text.lower())
+            kind, _, value = entry_key.partition(':')
+            suggestions.append({
+                'text': text,
+                'kind': KINDS[kind],
+                'category_id': int(value) if kind == CATEGORY else None,
+            })
+        return suggestions
+
+    def suggest(self, query, limit=DEFAULT_LIMIT):
+        """Return up to ``limit`` suggestions for ``query``, most popular first."""
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        self._current()
+        with self._lock:
+            return self._lookup(prefix, limit)
+
+
+autocomplete_index = AutocompleteIndex()
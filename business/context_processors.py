@@ -1,6 +1,10 @@
-from .models import Notification
+from django.utils.functional import SimpleLazyObject
+
+from . import notifications as notification_center
 
 def notifications(request):
     if request.user.is_authenticated:
-        return {'unread_notifications_count': Notification.objects.filter(recipient=request.user, is_read=False).count()}
+        # Only counted (or read from the cache) by templates that show it
+        user = request.user
+        return {'unread_notifications_count': SimpleLazyObject(lambda: notification_center.unread_count(user))}
     return {}
\ No newline at end of file
@@ -0,0 +1,166 @@
+"""
+Write-coalescing view counter for items.
+
+A view only increments a counter in the cache. Pending increments are
+written to ``Item.views`` in batched ``UPDATE`` statements by a background
+thread of the process that recorded them, every ``ITEM_VIEWS_FLUSH_INTERVAL``
+seconds, together with their trending scores (``trending.store_views``), so the item detail page no longer takes a database write lock. A
+worker that is killed loses at most one interval of views.
+
+With a shared cache (memcached, Redis) ``manage.py flush_item_views`` can
+flush the counts of every process; with the default per-process cache it
+refuses to run, as it would only see its own empty cache.
+
+Only one flush runs at a time (a lock in the cache), and it takes its counts
+out of the cache before writing them, so no view is written twice.
+"""
+import atexit
+import logging
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connection, transaction
+from django.db.models import F
+
+from . import trending
+
+logger = logging.getLogger(__name__)
+
+PENDING_KEY = 'item_views:pending:{}'
+FLUSH_LOCK_KEY = 'item_views:flush_lock'
+FLUSH_INTERVAL = getattr(settings, 'ITEM_VIEWS_FLUSH_INTERVAL', 30)
+# Longest a flush may hold the lock before others may take it over
+FLUSH_LOCK_TIMEOUT = 60
+
+
+def cache_is_shared():
+    return not isinstance(caches[DEFAULT_CACHE_ALIAS], (LocMemCache, DummyCache))
+
+
+class ViewCounter:
+    def __init__(self):
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._flusher = None
+
+    def _add_pending(self, item_id, count):
+        key = PENDING_KEY.format(item_id)
+        cache.add(key, 0, None)
+        try:
+            cache.incr(key, count)
+        except ValueError:
+            # Evicted between add() and incr()
+            cache.set(key, count, None)
+
+    def increment(self, item_id):
+        self._add_pending(item_id, 1)
+        with self._lock:
+            self._dirty.add(item_id)
+            if self._flusher is None or not self._flusher.is_alive():
+                self._flusher = threading.Thread(target=self._run_flusher, name='item-view-flush', daemon=True)
+                self._flusher.start()
+
+    def _run_flusher(self):
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Flushing item views failed')
+            finally:
+                # The thread's own connection; don't hold it between flushes
+                connection.close()
+
+    def pending(self, item_id):
+        return cache.get(PENDING_KEY.format(item_id)) or 0
+
+    def pending_many(self, item_ids):
+        keys = {PENDING_KEY.format(item_id): item_id for item_id in item_ids}
+        return {keys[key]: count for key, count in cache.get_many(keys).items() if count}
+
+    def _acquire(self, blocking):
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + FLUSH_LOCK_TIMEOUT
+        while not cache.add(FLUSH_LOCK_KEY, token, FLUSH_LOCK_TIMEOUT):
+            if not blocking or time.monotonic() > deadline:
+                return None
+            time.sleep(0.1)
+        return token
+
+    def flush(self, item_ids=None, blocking=False):
+        """
+        Move pending increments into ``Item.views``; returns the number of views written.
+
+        Without ``item_ids`` only the items this process has counted are
+        flushed. If another flush holds the lock this one does nothing,
+        unless ``blocking`` is set, in which case it waits for the lock.
+        """
+        own = item_ids is None
+        if own:
+            with self._lock:
+                item_ids, self._dirty = self._dirty, set()
+
+        token = self._acquire(blocking)
+        if token is None:
+            if own:
+                with self._lock:
+                    self._dirty.update(item_ids)
+            return 0
+        try:
+            return self._flush(item_ids)
+        except Exception:
+            if own:
+                with self._lock:
+                    self._dirty.update(item_ids)
+            raise
+        finally:
+            if cache.get(FLUSH_LOCK_KEY) == token:
+                cache.delete(FLUSH_LOCK_KEY)
+
+    def _flush(self, item_ids):
+        from .models import Item
+
+        # Claim the counts before writing them. They are decremented rather
+        # than deleted, so views recorded meanwhile are kept for the next flush.
+        claimed = {}
+        for item_id, count in self.pending_many(item_ids).items():
+            try:
+                cache.decr(PENDING_KEY.format(item_id), count)
+            except ValueError:
+                # Evicted since it was read; nothing left to claim
+                continue
+            claimed[item_id] = count
+        if not claimed:
+            return 0
+
+        # One UPDATE per distinct increment rather than one per item
+        batches = defaultdict(list)
+        for item_id, count in claimed.items():
+            batches[count].append(item_id)
+        try:
+            with transaction.atomic():
+                for count, ids in batches.items():
+                    Item.objects.filter(id__in=ids).update(views=F('views') + count)
+                trending.store_views(claimed)
+        except Exception:
+            for item_id, count in claimed.items():
+                self._add_pending(item_id, count)
+            raise
+        return sum(claimed.values())
+
+
+view_counter = ViewCounter()
+
+
+@atexit.register
+def _flush_on_exit():
+    try:
+        view_counter.flush(blocking=True)
+    except Exception:
+        pass
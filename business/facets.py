@@ -0,0 +1,250 @@
+"""
+Faceted attribute filtering for category listings.
+
+For every category the index keeps the ids of its active items in a sorted
+array and one bitmap (a plain Python ``int``) per (attribute, value) pair:
+bit ``n`` is set when the n-th item of the array carries that value. AND/OR
+filters are then bitwise operations and facet counts are ``int.bit_count()``,
+so a request never joins the ProductAttributeValue table.
+
+Each process holds its own copy, built lazily per category from the
+denormalized ``Item.attributes`` column and patched in place when an item is
+saved or deleted. A per-category generation number in the cache tells other
+processes that their copy is out of date. That only reaches them through a
+shared cache, so every copy is also rebuilt once it is older than
+``FACET_INDEX_MAX_AGE`` seconds; with the default per-process cache, changes
+made by other processes show up within that time.
+"""
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.cache import cache
+
+GENERATION_KEY = 'facets:generation:{}'
+MAX_AGE = getattr(settings, 'FACET_INDEX_MAX_AGE', 300)
+
+
+class CategoryFacets:
+    def __init__(self, generation, rows):
+        self.generation = generation
+        self.built_at = time.monotonic()
+        self.item_ids = array('q')
+        self.documents = {}
+        self.live = 0
+        self.postings = {}
+        for item_id, attributes in sorted(rows):
+            self.add(item_id, attributes)
+
+    def expired(self):
+        return time.monotonic() - self.built_at > MAX_AGE
+
+    def _bit(self, item_id):
+        position = bisect_left(self.item_ids, item_id)
+        if position < len(self.item_ids) and self.item_ids[position] == item_id:
+            return 1 << position
+        return None
+
+    def add(self, item_id, attributes):
+        """Add an item; returns False if it cannot be appended in place."""
+        if self.item_ids and item_id < self.item_ids[-1] and self._bit(item_id) is None:
+            # Positions are array indexes, so only ids past the end can be
+            # added without renumbering. The caller rebuilds instead.
+            return False
+        bit = self._bit(item_id)
+        if bit is None:
+            self.item_ids.append(item_id)
+            bit = 1 << (len(self.item_ids) - 1)
+        self.documents[item_id] = attributes
+        self.live |= bit
+        for name, value in attributes.items():
+            values = self.postings.setdefault(name, {})
+            values[value] = values.get(value, 0) | bit
+        return True
+
+    def remove(self, item_id):
+        attributes = self.documents.pop(item_id, None)
+        if attributes is None:
+            return
+        # The slot stays in item_ids as a tombstone; clearing its bit is enough.
+        mask = ~self._bit(item_id)
+        self.live &= mask
+        for name, value in attributes.items():
+            values = self.postings[name]
+            values[value] &= mask
+            if not values[value]:
+                del values[value]
+
+    def match(self, selections):
+        """
+        Return ``(matches, counts)`` for ``selections`` ({attribute: [values]}).
+
+        Values of one attribute are OR-ed, attributes are AND-ed. Each facet
+        count ignores the attribute's own selection, so picking "8GB" still
+        shows how many items have "16GB".
+        """
+        unions = {}
+        for name, values in selections.items():
+            postings = self.postings.get(name, {})
+            union = 0
+            for value in values:
+                union |= postings.get(value, 0)
+            unions[name] = union
+
+        matches = self.live
+        for union in unions.values():
+            matches &= union
+
+        counts = {}
+        for name, values in self.postings.items():
+            base = self.live
+            for other, union in unions.items():
+                if other != name:
+                    base &= union
+            for value, bitmap in values.items():
+                count = (bitmap & base).bit_count()
+                if count:
+                    counts.setdefault(name, {})[value] = count
+        return matches, counts
+
+    def ids(self, bitmap):
+        bits = bin(bitmap)[:1:-1]
+        ids = []
+        position = bits.find('1')
+        while position != -1:
+            ids.append(self.item_ids[position])
+            position = bits.find('1', position + 1)
+        return ids
+
+
+class FacetIndex:
+    def __init__(self):
+        self._categories = {}
+        self._lock = threading.Lock()
+
+    def _load(self, category_id, generation):
+        from .models import Item
+
+        rows = Item.objects.filter(
+            category_obj_id=category_id, status='active'
+        ).values_list('id', 'attributes')
+        return CategoryFacets(generation, [(item_id, attributes or {}) for item_id, attributes in rows])
+
+    def _generations(self, category_ids):
+        keys = {category_id: GENERATION_KEY.format(category_id) for category_id in category_ids}
+        found = cache.get_many(keys.values())
+        generations = {}
+        for category_id, key in keys.items():
+            if key not in found:
+                cache.add(key, 1, None)
+                found[key] = cache.get(key, 1)
+            generations[category_id] = found[key]
+        return generations
+
+    def get(self, category_ids):
+        """Return up-to-date CategoryFacets for each of ``category_ids``."""
+        generations = self._generations(category_ids)
+        result = []
+        for category_id, generation in generations.items():
+            facets = self._categories.get(category_id)
+            if facets is None or facets.generation != generation or facets.expired():
+                facets = self._load(category_id, generation)
+                with self._lock:
+                    self._categories[category_id] = facets
+            result.append(facets)
+        return result
+
+    def _bump(self, category_id, facets):
+        key = GENERATION_KEY.format(category_id)
+        cache.add(key, 0, None)
+        try:
+            generation = cache.incr(key)
+        except ValueError:
+            generation = None
+        # Keep the local copy only if no other process changed it meanwhile
+        if facets is not None and generation is not None and generation == facets.generation + 1:
+            facets.generation = generation
+        else:
+            with self._lock:
+                self._categories.pop(category_id, None)
+
+    def update_item(self, item, previous_category_id=None):
+        """Re-index ``item`` after it was created, edited, sold or re-listed."""
+        category_id = item.category_obj_id
+        if previous_category_id is not None and previous_category_id != category_id:
+            self.remove_item(item.pk, previous_category_id)
+        if category_id is None:
+            return
+
+        facets = self._categories.get(category_id)
+        if facets is not None:
+            with self._lock:
+                facets.remove(item.pk)
+                if item.status == 'active' and not facets.add(item.pk, item.attributes or {}):
+                    facets = None
+        self._bump(category_id, facets)
+
+    def remove_item(self, item_id, category_id):
+        facets = self._categories.get(category_id)
+        if facets is not None:
+            with self._lock:
+                facets.remove(item_id)
+        if category_id is not None:
+            self._bump(category_id, facets)
+
+    def search(self, category_ids, selections):
+        """
+        Filter the active items of ``category_ids`` by ``selections``.
+
+        Returns ``(item_ids, counts)`` where ``counts`` is
+        {attribute: {value: number of matching items}}. ``item_ids`` is None
+        when nothing is selected.
+        """
+        item_ids = [] if selections else None
+        counts = {}
+        for facets in self.get(category_ids):
+            with self._lock:
+                matches, category_counts = facets.match(selections)
+                if selections:
+                    item_ids.extend(facets.ids(matches))
+            for name, values in category_counts.items():
+                totals = counts.setdefault(name, {})
+                for value, count in values.items():
+                    totals[value] = totals.get(value, 0) + count
+        return item_ids, counts
+
+
+facet_index = FacetIndex()
+
+
+def parse_selections(values):
+    """Turn ``?facet=RAM:8GB&facet=RAM:16GB`` into {'RAM': ['8GB', '16GB']}."""
+    selections = {}
+    for raw in values:
+        name, sep, value = raw.partition(':')
+        if sep and name and value:
+            selections.setdefault(name, [])
+            if value not in selections[name]:
+                selections[name].append(value)
+    return selections
+
+
+def facet_groups(counts, selections, max_values=20):
+    """Shape facet counts for the template, most common values first."""
+    groups = []
+    for name in sorted(set(counts) | set(selections)):
+        values = counts.get(name, {})
+        selected = selections.get(name, [])
+        ranked = sorted(values.items(), key=lambda pair: (-pair[1], pair[0]))[:max_values]
+        shown = {value for value, _ in ranked}
+        ranked += [(value, 0) for value in selected if value not in shown]
+        groups.append({
+            'name': name,
+            'values': [
+                {'value': value, 'count': count, 'param': f'{name}:{value}', 'selected': value in selected}
+                for value, count in ranked
+            ],
+        })
+    return groups
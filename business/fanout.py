@@ -0,0 +1,218 @@
+"""
+Background fan-out of new-item notifications to company followers.
+
+Saving an item only records a ``NotificationFanout`` job (and, for
+companies large enough to fan out on read, one entry in the company's
+activity stream; see ``business.notifications``). Once the
+transaction commits, a worker thread in the same process works through the
+company's followers in id order:
+
+* in-app notifications, unless the item went to the stream, are inserted
+  ``NOTIFICATION_FANOUT_CHUNK_SIZE`` at a time, each chunk committed
+  together with the job's progress;
+* emails go out one per recipient over a single SMTP connection,
+  ``NOTIFICATION_EMAIL_BATCH_SIZE`` per batch, recording progress after
+  every batch.
+
+A job is claimed with a conditional UPDATE before it runs, and every
+progress write checks that the claim is still held, so the worker thread and
+``manage.py process_notification_fanouts`` never deliver the same job twice.
+Claims lapse after ``NOTIFICATION_FANOUT_CLAIM_TIMEOUT`` seconds without
+progress. A write that fails with ``OperationalError`` (SQLite's "database
+is locked" while requests write) is retried with exponential backoff,
+resuming from the recorded progress. A job cut short by a crash or restart
+is resumed by the management command.
+"""
+import logging
+import queue
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import OperationalError, connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import notifications
+from .models import Notification, NotificationFanout
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = getattr(settings, 'NOTIFICATION_FANOUT_CHUNK_SIZE', 1000)
+EMAIL_BATCH_SIZE = getattr(settings, 'NOTIFICATION_EMAIL_BATCH_SIZE', 100)
+CLAIM_TIMEOUT = timedelta(seconds=getattr(settings, 'NOTIFICATION_FANOUT_CLAIM_TIMEOUT', 300))
+RETRIES = getattr(settings, 'NOTIFICATION_FANOUT_RETRIES', 5)
+RETRY_DELAY = 0.5
+
+
+class LostClaim(Exception):
+    """Another worker took the job over after our claim lapsed."""
+
+
+def enqueue(item):
+    in_app = notifications.fans_out_on_write(item.company)
+    if not in_app:
+        notifications.publish(item)
+    job = NotificationFanout.objects.create(item=item, in_app=in_app)
+    transaction.on_commit(lambda: worker.submit(job.id))
+    return job
+
+
+def pending():
+    return NotificationFanout.objects.filter(finished_at__isnull=True).order_by('id')
+
+
+def process(job_id):
+    """
+    Claim and run (or resume) a job. Returns False if it has finished
+    already or another worker holds it.
+    """
+    owner = uuid.uuid4().hex
+    delay = RETRY_DELAY
+    for attempt in range(RETRIES + 1):
+        try:
+            return _run(job_id, owner)
+        except LostClaim:
+            logger.warning('Notification fan-out %s was taken over by another worker', job_id)
+            return False
+        except OperationalError:
+            if attempt == RETRIES:
+                _release(job_id, owner)
+                raise
+            logger.warning('Notification fan-out %s hit a database error, retrying in %.1fs', job_id, delay)
+            time.sleep(delay)
+            delay *= 2
+        except Exception:
+            _release(job_id, owner)
+            raise
+
+
+def _claim(job_id, owner):
+    now = timezone.now()
+    return pending().filter(id=job_id).filter(
+        Q(claimed_by=owner) | Q(claimed_at__isnull=True) | Q(claimed_at__lt=now - CLAIM_TIMEOUT)
+    ).update(claimed_by=owner, claimed_at=now) == 1
+
+
+def _release(job_id, owner):
+    try:
+        NotificationFanout.objects.filter(id=job_id, claimed_by=owner).update(claimed_by='', claimed_at=None)
+    except OperationalError:
+        # The claim lapses on its own after CLAIM_TIMEOUT
+        logger.exception('Could not release notification fan-out %s', job_id)
+
+
+def _save_progress(job, **fields):
+    """Record progress, refreshing the claim; raises LostClaim if it is gone."""
+    fields = {'claimed_at': timezone.now(), **fields}
+    updated = NotificationFanout.objects.filter(id=job.id, claimed_by=job.claimed_by).update(**fields)
+    if not updated:
+        raise LostClaim(job.id)
+    for name, value in fields.items():
+        setattr(job, name, value)
+
+
+def _run(job_id, owner):
+    if not _claim(job_id, owner):
+        return False
+    job = NotificationFanout.objects.select_related('item__company').get(id=job_id)
+    _notify(job)
+    _email(job)
+    _save_progress(job, finished_at=timezone.now(), claimed_by='', claimed_at=None)
+    return True
+
+
+def _notify(job):
+    if not job.in_app:
+        return
+    item = job.item
+    followers = item.company.followers.order_by('id')
+    while True:
+        with transaction.atomic():
+            follower_ids = list(
+                followers.filter(id__gt=job.notified_up_to).values_list('id', flat=True)[:CHUNK_SIZE]
+            )
+            if not follower_ids:
+                return
+            Notification.objects.bulk_create([
+                Notification(
+                    recipient_id=follower_id,
+                    message=f"New from {item.company.name}: {item.title}",
+                    link=f"/item/{item.id}/"
+                )
+                for follower_id in follower_ids
+            ])
+            # Rolls the chunk back if the claim was lost meanwhile
+            _save_progress(job, notified_up_to=follower_ids[-1])
+            transaction.on_commit(lambda follower_ids=follower_ids: notifications.invalidate(follower_ids))
+
+
+def _email(job):
+    item = job.item
+    subject = f"New Product from {item.company.name}: {item.title}"
+    # In production, use your actual domain or Django's Site framework
+    item_url = f"http://127.0.0.1:8000/item/{item.id}/"
+    message = (
+        f"Hello,\n\n"
+        f"{item.company.name} has just posted a new product: {item.title}.\n\n"
+        f"Price: {item.price}\n\n"
+        f"View it here: {item_url}\n\n"
+        f"Best regards,\nU-Connect Team"
+    )
+    from_email = getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@u-connect.com')
+
+    followers = item.company.followers.exclude(email='').order_by('id')
+    # One connection for the whole job; each follower gets their own message
+    # so addresses are not disclosed to each other. Failures raise, and only
+    # the recipients whose message went out count as done.
+    with get_connection(fail_silently=False) as connection:
+        while True:
+            recipients = list(
+                followers.filter(id__gt=job.emailed_up_to).values_list('id', 'email')[:EMAIL_BATCH_SIZE]
+            )
+            if not recipients:
+                return
+            sent_up_to = job.emailed_up_to
+            try:
+                for recipient_id, email in recipients:
+                    connection.send_messages([
+                        EmailMessage(subject, message, from_email, [email], connection=connection)
+                    ])
+                    sent_up_to = recipient_id
+            finally:
+                if sent_up_to != job.emailed_up_to:
+                    _save_progress(job, emailed_up_to=sent_up_to)
+
+
+class FanoutWorker:
+    """Runs submitted jobs one at a time on a daemon thread."""
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, job_id):
+        self._queue.put(job_id)
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='notification-fanout', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            job_id = self._queue.get()
+            try:
+                process(job_id)
+            except Exception:
+                # Retries are exhausted (or delivery failed); the job stays
+                # pending, unclaimed, for process_notification_fanouts
+                logger.exception('Notification fan-out %s failed', job_id)
+            finally:
+                connections.close_all()
+
+
+worker = FanoutWorker()
@@ -0,0 +1,170 @@
+"""
+Personalized home feed.
+
+Ranking happens in two stages. Candidate generation pulls a few hundred
+active items from the visitor's signals: the categories of recently viewed
+items, the last search, followed companies and the trending board. A
+cheap linear scorer then ranks that union. The ranked ids are cached per
+visitor for ``FEED_CACHE_TIMEOUT`` seconds so infinite-scroll pages slice
+the cached list instead of ranking again. Once the ranked list runs out,
+the feed continues with every other active item, newest first.
+"""
+import hashlib
+import math
+
+from django.core import signing
+from django.core.cache import cache
+from django.db import transaction, DatabaseError
+from django.utils import timezone
+
+from .models import Item
+from .pagination import keyset_page, InvalidCursor
+from . import search, trending
+
+FEED_CACHE_TIMEOUT = 120
+FEED_CURSOR_SALT = 'business.home-feed'
+CANDIDATES_PER_SOURCE = 60
+
+# Scorer weights
+CATEGORY_WEIGHT = 3.0
+SEARCH_WEIGHT = 2.5
+FOLLOWED_WEIGHT = 2.0
+TRENDING_WEIGHT = 1.5
+FRESHNESS_WEIGHT = 1.0
+FRESHNESS_DAYS = 7
+
+
+def _signals(request):
+    viewed = [int(i) for i in request.session.get('viewed_items', [])][-20:]
+    last_search = request.session.get('last_search') or ''
+    followed = []
+    if request.user.is_authenticated:
+        followed = list(request.user.following_companies.values_list('id', flat=True))
+    return viewed, last_search, followed
+
+
+def _cache_key(request, viewed, last_search, followed):
+    fingerprint = hashlib.md5(
+        repr((viewed[-10:], last_search, followed)).encode()
+    ).hexdigest()
+    if request.user.is_authenticated:
+        owner = f'u{request.user.id}'
+    elif viewed or last_search:
+        owner = f's{request.session.session_key}'
+    else:
+        # No signals at all: every anonymous visitor gets the same feed
+        owner = 'anon'
+    return f'feed:{owner}:{fingerprint}'
+
+
+def _rank(viewed, last_search, followed):
+    active = Item.objects.filter(status='active')
+    viewed_set = set(viewed)
+
+    # Stage 1: candidate generation
+    category_affinity = {}
+    if viewed:
+        categories = dict(Item.objects.filter(id__in=viewed).values_list('id', 'category_obj_id'))
+        for position, item_id in enumerate(reversed(viewed)):
+            category_id = categories.get(item_id)
+            if category_id is not None:
+                # Categories viewed more recently count for more
+                category_affinity[category_id] = category_affinity.get(category_id, 0) + 1 / (1 + position)
+        top = max(category_affinity.values(), default=1)
+        category_affinity = {c: a / top for c, a in category_affinity.items()}
+
+    candidate_ids = set()
+    if category_affinity:
+        candidate_ids.update(active.filter(
+            category_obj_id__in=list(category_affinity)
+        ).order_by('-created_at').values_list('id', flat=True)[:CANDIDATES_PER_SOURCE])
+
+    search_rank = {}
+    if last_search:
+        try:
+            with transaction.atomic():
+                hits = search.get_backend().search(last_search, limit=CANDIDATES_PER_SOURCE)
+        except DatabaseError:
+            hits = []
+        search_rank = {item_id: position for position, item_id in enumerate(hits)}
+        candidate_ids.update(hits)
+
+    if followed:
+        candidate_ids.update(active.filter(
+            company_id__in=followed
+        ).order_by('-created_at').values_list('id', flat=True)[:CANDIDATES_PER_SOURCE])
+
+    trending_rank = {
+        card['id']: position
+        for position, card in enumerate(trending.top('global', CANDIDATES_PER_SOURCE))
+    }
+    candidate_ids.update(trending_rank)
+    candidate_ids -= viewed_set
+
+    # Stage 2: score the union
+    now = timezone.now()
+    followed_set = set(followed)
+    scored = []
+    rows = active.filter(id__in=candidate_ids).values_list('id', 'category_obj_id', 'company_id', 'created_at')
+    for item_id, category_id, company_id, created_at in rows:
+        score = CATEGORY_WEIGHT * category_affinity.get(category_id, 0)
+        if item_id in search_rank:
+            score += SEARCH_WEIGHT * (1 - search_rank[item_id] / len(search_rank))
+        if company_id in followed_set:
+            score += FOLLOWED_WEIGHT
+        if item_id in trending_rank:
+            score += TRENDING_WEIGHT * (1 - trending_rank[item_id] / len(trending_rank))
+        age_days = (now - created_at).total_seconds() / 86400
+        score += FRESHNESS_WEIGHT * math.exp(-age_days / FRESHNESS_DAYS)
+        scored.append((score, item_id))
+
+    scored.sort(key=lambda pair: (-pair[0], -pair[1]))
+    return [item_id for _, item_id in scored]
+
+
+def ranked_ids(request):
+    """Return the visitor's ranked candidate ids, from the cache when possible."""
+    viewed, last_search, followed = _signals(request)
+    key = _cache_key(request, viewed, last_search, followed)
+    ids = cache.get(key)
+    if ids is None:
+        ids = _rank(viewed, last_search, followed)
+        cache.set(key, ids, FEED_CACHE_TIMEOUT)
+    return ids
+
+
+def feed_page(request, queryset, cursor=None, per_page=12):
+    """
+    Return ``(items, next_cursor)`` for the personalized feed.
+
+    Cursors are signed tokens holding either an offset into the ranked list
+    or, once that is used up, a keyset cursor into the newest-first remainder.
+    """
+    state = {'o': 0}
+    if cursor:
+        try:
+            state = signing.loads(cursor, salt=FEED_CURSOR_SALT)
+        except signing.BadSignature:
+            raise InvalidCursor('Malformed cursor.')
+
+    ranked = ranked_ids(request)
+    if 'o' in state and int(state['o']) < len(ranked):
+        offset = int(state['o'])
+        chunk = ranked[offset:offset + per_page]
+        found = queryset.in_bulk(chunk)
+        items = [found[item_id] for item_id in chunk if item_id in found]
+        offset += len(chunk)
+        if offset < len(ranked):
+            next_state = {'o': offset}
+        elif queryset.exclude(id__in=ranked).exists():
+            next_state = {'n': ''}
+        else:
+            next_state = None
+    else:
+        items, newest_cursor = keyset_page(
+            queryset.exclude(id__in=ranked), 'newest', state.get('n') or None, per_page=per_page
+        )
+        next_state = {'n': newest_cursor} if newest_cursor else None
+
+    next_cursor = signing.dumps(next_state, salt=FEED_CURSOR_SALT) if next_state else None
+    return items, next_cursor
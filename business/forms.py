@@ -1,5 +1,5 @@
 from django import forms
-from .models import Item, ProductAttributeValue, Company, Review, Report, Comment
+from .models import Item, ProductAttributeValue, Company, Review, Report, Comment, BRAND_ATTRIBUTE_NAMES
 
 class ItemForm(forms.ModelForm):
     class Meta:
@@ -91,7 +91,7 @@ class ItemForm(forms.ModelForm):
                 # Add a special class to identify dynamic attributes for JS wizard
                 self.fields[field_name].widget.attrs['data-wizard-step'] = '2' # Default to step 2
                 # If it's Brand/Make, move to step 1
-                if attr.name in ['Brand', 'Make', 'Provider', 'Publisher', 'Company']:
+                if attr.name in BRAND_ATTRIBUTE_NAMES:
                     self.fields[field_name].widget.attrs['data-wizard-step'] = '1'
 
     def save(self, commit=True):
@@ -101,10 +101,14 @@ class ItemForm(forms.ModelForm):
         if commit:
             item.save()
             # Save dynamic attributes
+            attribute_values = []
             for name, value in self.cleaned_data.items():
                 if name.startswith('attr_') and value:
                     attr_id = int(name.replace('attr_', ''))
-                    ProductAttributeValue.objects.create(product=item, attribute_id=attr_id, value=value)
+                    attribute_values.append(ProductAttributeValue(product=item, attribute_id=attr_id, value=value))
+            if attribute_values:
+                ProductAttributeValue.objects.bulk_create(attribute_values)
+                item.sync_attributes()
         return item
 
 class CompanyForm(forms.ModelForm):
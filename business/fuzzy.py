@@ -0,0 +1,234 @@
+"""
+Typo-tolerant matching on item titles and company names.
+
+Text is split into words and every word into the trigrams of ``"  word "``,
+the way ``pg_trgm`` does it, so "samsng" still shares most of its trigrams
+with "Samsung". A match scores the share of the query's trigrams found in the
+document. Item documents are the title plus the brand, so misspelled brand
+names find their items too.
+
+SQLite keeps the trigrams in a side table maintained from
+``business/signals.py``. PostgreSQL uses ``pg_trgm`` and its
+``word_similarity`` directly on the tables. Either way only a bounded number
+of postings and candidates is looked at, so a query costs the same however
+large the catalogue gets; the caller's filters are applied to those
+candidates.
+"""
+import math
+
+from django.db import connection, transaction, DatabaseError
+from django.db.models import Case, FloatField, Value, When
+
+from .search import no_matches, tokenize
+
+TRIGRAM_TABLE = 'business_trigram'
+
+ITEM, COMPANY = 'item', 'company'
+
+# Share of the query's trigrams a document must contain
+THRESHOLD = 0.5
+
+# Candidates returned per query and postings read per query trigram
+MAX_CANDIDATES = 200
+POSTINGS_LIMIT = 2000
+
+# Longer queries are cut down to this many trigrams
+MAX_QUERY_TRIGRAMS = 24
+
+
+def trigrams(text):
+    grams = set()
+    for word in tokenize(text):
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def item_document(item):
+    return f'{item.title or ""} {item.brand or ""}'
+
+
+class BaseFuzzyBackend:
+    available = False
+
+    def index(self, kind, object_id, text):
+        pass
+
+    def remove(self, kind, object_id):
+        pass
+
+    def clear(self):
+        pass
+
+    def search(self, kind, query, limit=MAX_CANDIDATES):
+        """Return ``[(object_id, score), ...]`` for ``query``, best first."""
+        return []
+
+
+class SQLiteFuzzyBackend(BaseFuzzyBackend):
+    """Trigram postings in a WITHOUT ROWID side table."""
+
+    available = True
+
+    def index(self, kind, object_id, text):
+        self.remove(kind, object_id)
+        grams = trigrams(text)
+        if grams:
+            with connection.cursor() as cursor:
+                cursor.executemany(
+                    f"INSERT INTO {TRIGRAM_TABLE} (kind, trigram, object_id) VALUES (%s, %s, %s)",
+                    [(kind, gram, object_id) for gram in grams],
+                )
+
+    def remove(self, kind, object_id):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {TRIGRAM_TABLE} WHERE kind = %s AND object_id = %s", [kind, object_id]
+            )
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {TRIGRAM_TABLE}")
+
+    def search(self, kind, query, limit=MAX_CANDIDATES):
+        grams = sorted(trigrams(query))[:MAX_QUERY_TRIGRAMS]
+        if not grams:
+            return []
+        needed = max(1, math.ceil(THRESHOLD * len(grams)))
+        with connection.cursor() as cursor:
+            # Posting list lengths, counted no further than POSTINGS_LIMIT
+            cursor.execute(
+                ' UNION ALL '.join(
+                    f"SELECT %s, (SELECT COUNT(*) FROM (SELECT 1 FROM {TRIGRAM_TABLE} "
+                    f"WHERE kind = %s AND trigram = %s LIMIT {POSTINGS_LIMIT}))"
+                    for _ in grams
+                ),
+                [value for gram in grams for value in (gram, kind, gram)],
+            )
+            sizes = dict(cursor.fetchall())
+            # A match holds at least `needed` of the query's trigrams, so at
+            # least one of the len(grams) - needed + 1 rarest; their postings,
+            # newest first and cut at POSTINGS_LIMIT, are the candidates
+            rare = sorted(grams, key=lambda gram: (sizes[gram], gram))[:len(grams) - needed + 1]
+            rare = [gram for gram in rare if sizes[gram]]
+            if not rare:
+                return []
+            candidates = ' UNION '.join(
+                f"SELECT * FROM (SELECT object_id FROM {TRIGRAM_TABLE} "
+                f"WHERE kind = %s AND trigram = %s ORDER BY object_id DESC LIMIT {POSTINGS_LIMIT})"
+                for _ in rare
+            )
+            in_grams = ', '.join(['%s'] * len(grams))
+            cursor.execute(
+                f"SELECT object_id, COUNT(*) AS hits FROM {TRIGRAM_TABLE} "
+                f"WHERE kind = %s AND trigram IN ({in_grams}) AND object_id IN ({candidates}) "
+                f"GROUP BY object_id HAVING COUNT(*) >= %s ORDER BY hits DESC, object_id DESC LIMIT %s",
+                [kind, *grams, *[value for gram in rare for value in (kind, gram)], needed, limit],
+            )
+            return [(object_id, hits / len(grams)) for object_id, hits in cursor.fetchall()]
+
+
+class PostgresFuzzyBackend(BaseFuzzyBackend):
+    """``pg_trgm`` word similarity over GIN trigram expression indexes."""
+
+    available = True
+
+    EXPRESSIONS = {
+        ITEM: ('business_item', "lower(title || ' ' || brand)"),
+        COMPANY: ('business_company', 'lower(name)'),
+    }
+
+    def search(self, kind, query, limit=MAX_CANDIDATES):
+        if not trigrams(query):
+            return []
+        table, expression = self.EXPRESSIONS[kind]
+        with connection.cursor() as cursor:
+            # Transaction-local; the caller runs this inside atomic()
+            cursor.execute(
+                "SELECT set_config('pg_trgm.word_similarity_threshold', %s, true)", [str(THRESHOLD)]
+            )
+            cursor.execute(
+                f"SELECT id, word_similarity(lower(%s), {expression}) AS score FROM {table} "
+                f"WHERE lower(%s) <%% {expression} ORDER BY score DESC, id DESC LIMIT %s",
+                [query, query, limit],
+            )
+            return cursor.fetchall()
+
+
+BACKENDS = {
+    'sqlite': SQLiteFuzzyBackend,
+    'postgresql': PostgresFuzzyBackend,
+}
+
+
+def get_backend():
+    return BACKENDS.get(connection.vendor, BaseFuzzyBackend)()
+
+
+def index_item(item):
+    index(ITEM, item.pk, item_document(item))
+
+
+def index_company(company):
+    index(COMPANY, company.pk, company.name)
+
+
+def index(kind, object_id, text):
+    try:
+        with transaction.atomic():
+            get_backend().index(kind, object_id, text)
+    except DatabaseError:
+        # Same as the full-text index: never break a save over it
+        pass
+
+
+def remove(kind, object_id):
+    try:
+        with transaction.atomic():
+            get_backend().remove(kind, object_id)
+    except DatabaseError:
+        pass
+
+
+def search_item_ids(query, limit=MAX_CANDIDATES):
+    """
+    Return ``{item_id: score}`` for up to ``limit`` items fuzzily matching
+    ``query``; scores run from 0 to 1.
+
+    Items of companies whose name matches count as matches too.
+    """
+    backend = get_backend()
+    if not backend.available:
+        return {}
+    try:
+        with transaction.atomic():
+            scores = dict(backend.search(ITEM, query, limit))
+            companies = dict(backend.search(COMPANY, query, limit))
+    except DatabaseError:
+        return {}
+
+    if companies:
+        from .models import Item
+
+        rows = Item.objects.filter(company_id__in=list(companies)).order_by('-id').values_list('id', 'company_id')
+        for item_id, company_id in rows[:limit]:
+            scores[item_id] = max(scores.get(item_id, 0), companies[company_id])
+    ranked = sorted(scores.items(), key=lambda pair: (-pair[1], -pair[0]))
+    return dict(ranked[:limit])
+
+
+def rank_items(queryset, query):
+    """
+    Typo-tolerant counterpart of ``search.search_items``: ``queryset``
+    filtered to the fuzzy candidates of ``query``, annotated with
+    ``search_rank`` (minus the score, so lower ranks match better).
+    """
+    scores = search_item_ids(query)
+    if not scores:
+        return no_matches(queryset)
+    return queryset.filter(id__in=list(scores)).annotate(
+        search_rank=Case(
+            *[When(id=item_id, then=Value(-score)) for item_id, score in scores.items()],
+            output_field=FloatField(),
+        )
+    )
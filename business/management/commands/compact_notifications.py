@@ -0,0 +1,41 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from business.models import Notification
+
+class Command(BaseCommand):
+    help = 'Deletes read notifications older than the retention period, in short transactions'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=getattr(settings, 'NOTIFICATION_RETENTION_DAYS', 180),
+            help='Keep read notifications for this many days',
+        )
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Ids scanned per transaction')
+        parser.add_argument('--pause', type=float, default=0, help='Seconds to wait between transactions')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        chunk_size = options['chunk_size']
+        # Ids grow with created_at, so nothing past the newest expired id qualifies
+        last_id = Notification.objects.filter(created_at__lt=cutoff).aggregate(last=Max('id'))['last'] or 0
+
+        deleted = 0
+        start = 0
+        while start < last_id:
+            # Each window is a primary-key range, keeping every write lock short
+            with transaction.atomic():
+                count, _ = Notification.objects.filter(
+                    id__gt=start, id__lte=start + chunk_size, is_read=True, created_at__lt=cutoff
+                ).delete()
+            deleted += count
+            start += chunk_size
+            if options['pause']:
+                time.sleep(options['pause'])
+
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} read notifications.'))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from business.models import Item
+from business.counters import cache_is_shared, view_counter
+
+class Command(BaseCommand):
+    help = 'Writes buffered item view counts from the cache to the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Items checked per cache round trip')
+
+    def handle(self, *args, **options):
+        if not cache_is_shared():
+            raise CommandError(
+                'The cache is local to each process, so this command cannot see the views buffered by the web '
+                'workers; they flush their own every ITEM_VIEWS_FLUSH_INTERVAL seconds. Configure a shared '
+                'CACHES backend (memcached, Redis) to flush them from here.'
+            )
+        chunk_size = options['chunk_size']
+        total = 0
+        last_id = 0
+        while True:
+            ids = list(
+                Item.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:chunk_size]
+            )
+            if not ids:
+                break
+            total += view_counter.flush(ids, blocking=True)
+            last_id = ids[-1]
+
+        self.stdout.write(self.style.SUCCESS(f'Flushed {total} pending views.'))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from business import fanout
+
+class Command(BaseCommand):
+    help = 'Delivers new-item notifications whose fan-out has not finished, resuming where it stopped'
+
+    def handle(self, *args, **options):
+        job_ids = list(fanout.pending().values_list('id', flat=True))
+        processed = failed = 0
+        for job_id in job_ids:
+            try:
+                done = fanout.process(job_id)
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f'Fan-out {job_id}: failed ({e})')
+                continue
+            if done:
+                processed += 1
+            if options['verbosity'] > 1:
+                self.stdout.write(f'Fan-out {job_id}: {"done" if done else "claimed by another worker"}')
+
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} notification fan-outs ({failed} failed).'))
@@ -0,0 +1,30 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from business import recommender
+
+class Command(BaseCommand):
+    help = 'Recomputes the related-items neighbour table (TF-IDF cosine similarity)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=12, help='Neighbours stored per item')
+        parser.add_argument('--chunk-size', type=int, default=256, help='Items scored per batch')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Worker processes')
+        parser.add_argument('--only-missing', action='store_true', help='Only compute items that have no neighbours yet')
+
+    def handle(self, *args, **options):
+        try:
+            import numpy  # noqa: F401
+            import scipy  # noqa: F401
+        except ImportError:
+            raise CommandError('NumPy and SciPy are required to build item neighbours.')
+
+        self.stdout.write('Computing item neighbours...')
+        updated = recommender.rebuild(
+            top_k=options['top_k'],
+            chunk_size=options['chunk_size'],
+            workers=options['workers'],
+            only_missing=options['only_missing'],
+            log=self.stdout.write if options['verbosity'] > 1 else None,
+        )
+        self.stdout.write(self.style.SUCCESS(f'Successfully updated neighbours for {updated} items.'))
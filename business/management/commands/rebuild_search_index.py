@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from business.models import Item, Company
+from business import search, fuzzy
+
+class Command(BaseCommand):
+    help = 'Rebuilds the full-text and trigram search indexes for all items'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Items indexed per transaction')
+
+    def handle(self, *args, **options):
+        backend = search.get_backend()
+        if not backend.available:
+            raise CommandError('Full-text search is not supported on this database backend.')
+
+        chunk_size = options['chunk_size']
+        self.stdout.write('Rebuilding search index...')
+
+        backend.clear()
+        trigrams = fuzzy.get_backend()
+        trigrams.clear()
+        items = Item.objects.select_related('category_obj').order_by('id')
+        total = 0
+        last_id = 0
+        while True:
+            chunk = list(items.filter(id__gt=last_id)[:chunk_size])
+            if not chunk:
+                break
+            with transaction.atomic():
+                for item in chunk:
+                    backend.index_item(item)
+                    trigrams.index(fuzzy.ITEM, item.pk, fuzzy.item_document(item))
+            total += len(chunk)
+            last_id = chunk[-1].id
+
+        with transaction.atomic():
+            for company in Company.objects.only('id', 'name'):
+                trigrams.index(fuzzy.COMPANY, company.pk, company.name)
+
+        self.stdout.write(self.style.SUCCESS(f'Successfully indexed {total} items.'))
@@ -0,0 +1,39 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from business import notifications
+from business.counters import cache_is_shared
+
+class Command(BaseCommand):
+    help = 'Recounts every user\'s unread notifications from the database and rewrites the cached counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Users recounted per cache round trip')
+
+    def handle(self, *args, **options):
+        if not cache_is_shared():
+            raise CommandError(
+                'The cache is local to each process, so this command would only repair its own empty copy; '
+                'the web workers recount their cached counters every NOTIFICATION_COUNT_CACHE_TIMEOUT seconds. '
+                'Configure a shared CACHES backend (memcached, Redis) to repair them from here.'
+            )
+        chunk_size = options['chunk_size']
+        recounted = fixed = 0
+        last_id = 0
+        while True:
+            users = list(User.objects.filter(id__gt=last_id).order_by('id')[:chunk_size])
+            if not users:
+                break
+            # The database is the source of truth; the cache only tells which
+            # of the recounted counters had drifted
+            cached = notifications.cached_counts([user.id for user in users])
+            for user in users:
+                count = notifications.count_unread(user)
+                if user.id in cached and count != cached[user.id]:
+                    fixed += 1
+                notifications.set_cached_count(user.id, count)
+                recounted += 1
+            last_id = users[-1].id
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Recounted {recounted} users, fixed {fixed} cached counters.'
+        ))
@@ -0,0 +1,62 @@
+from django.db import migrations
+
+
+def create_search_table(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS business_item_search USING fts5("
+            "title, description, category, attributes, "
+            "tokenize = 'unicode61 remove_diacritics 2')"
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            "CREATE TABLE IF NOT EXISTS business_item_search ("
+            "item_id bigint PRIMARY KEY REFERENCES business_item (id) ON DELETE CASCADE, "
+            "document tsvector NOT NULL)"
+        )
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS business_item_search_document_idx "
+            "ON business_item_search USING GIN (document)"
+        )
+
+
+def drop_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute("DROP TABLE IF EXISTS business_item_search")
+
+
+def populate_search_table(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            "INSERT INTO business_item_search (rowid, title, description, category, attributes) "
+            "SELECT i.id, i.title, i.description, COALESCE(c.name, i.category, ''), "
+            "COALESCE((SELECT group_concat(v.value, ' ') FROM business_productattributevalue v "
+            "WHERE v.product_id = i.id), '') "
+            "FROM business_item i LEFT JOIN business_category c ON c.id = i.category_obj_id"
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            "INSERT INTO business_item_search (item_id, document) "
+            "SELECT i.id, "
+            "setweight(to_tsvector('simple', i.title), 'A') || "
+            "setweight(to_tsvector('simple', COALESCE(c.name, i.category, '')), 'B') || "
+            "setweight(to_tsvector('simple', COALESCE((SELECT string_agg(v.value, ' ') "
+            "FROM business_productattributevalue v WHERE v.product_id = i.id), '')), 'C') || "
+            "setweight(to_tsvector('simple', i.description), 'D') "
+            "FROM business_item i LEFT JOIN business_category c ON c.id = i.category_obj_id "
+            "ON CONFLICT (item_id) DO NOTHING"
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('business', '0018_comment'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_table, drop_search_table),
+        migrations.RunPython(populate_search_table, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.8 on 2026-10-17 10:04
+
+from django.db import migrations, models
+
+BRAND_ATTRIBUTE_NAMES = ['Brand', 'Make', 'Provider', 'Publisher', 'Company']
+
+
+def populate_attributes(apps, schema_editor):
+    Item = apps.get_model('business', 'Item')
+    ProductAttributeValue = apps.get_model('business', 'ProductAttributeValue')
+
+    documents = {}
+    values = ProductAttributeValue.objects.select_related('attribute').order_by('product_id', 'id')
+    for value in values.iterator():
+        document = documents.setdefault(value.product_id, {'attributes': {}, 'brand': ''})
+        document['attributes'][value.attribute.name] = value.value
+        if not document['brand'] and value.attribute.name in BRAND_ATTRIBUTE_NAMES:
+            document['brand'] = value.value[:255]
+
+    for item_id, document in documents.items():
+        Item.objects.filter(pk=item_id).update(**document)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('business', '0019_item_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='attributes',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='brand',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(populate_attributes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.8 on 2026-10-17 10:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('business', '0020_item_attributes_item_brand'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItemNeighbours',
+            fields=[
+                ('item', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='neighbours', serialize=False, to='business.item')),
+                ('neighbour_ids', models.JSONField(default=list)),
+                ('scores', models.JSONField(default=list)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Item neighbours',
+            },
+        ),
+    ]
@@ -0,0 +1,74 @@
+import re
+
+from django.db import migrations
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def trigrams(text):
+    grams = set()
+    for word in WORD_RE.findall((text or '').lower()):
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def create_trigram_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE TABLE IF NOT EXISTS business_trigram ("
+            "kind varchar(16) NOT NULL, trigram varchar(3) NOT NULL, object_id integer NOT NULL, "
+            "PRIMARY KEY (kind, trigram, object_id)) WITHOUT ROWID"
+        )
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS business_trigram_object_idx ON business_trigram (kind, object_id)"
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS business_item_title_trgm_idx "
+            "ON business_item USING GIN (lower(title || ' ' || brand) gin_trgm_ops)"
+        )
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS business_company_name_trgm_idx "
+            "ON business_company USING GIN (lower(name) gin_trgm_ops)"
+        )
+
+
+def drop_trigram_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS business_trigram")
+    elif vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS business_item_title_trgm_idx")
+        schema_editor.execute("DROP INDEX IF EXISTS business_company_name_trgm_idx")
+
+
+def populate_trigram_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    Item = apps.get_model('business', 'Item')
+    Company = apps.get_model('business', 'Company')
+    documents = [
+        ('item', item_id, f'{title} {brand}')
+        for item_id, title, brand in Item.objects.values_list('id', 'title', 'brand').iterator()
+    ]
+    documents += [('company', company_id, name) for company_id, name in Company.objects.values_list('id', 'name')]
+    with schema_editor.connection.cursor() as cursor:
+        cursor.executemany(
+            "INSERT OR IGNORE INTO business_trigram (kind, trigram, object_id) VALUES (%s, %s, %s)",
+            [(kind, gram, object_id) for kind, object_id, text in documents for gram in trigrams(text)],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('business', '0021_itemneighbours'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+        migrations.RunPython(populate_trigram_table, migrations.RunPython.noop),
+    ]
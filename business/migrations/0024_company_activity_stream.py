@@ -0,0 +1,71 @@
+# Generated by Django 5.2.18 on 2026-10-17 10:34
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('business', '0023_notificationfanout'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationfanout',
+            name='in_app',
+            field=models.BooleanField(default=True),
+        ),
+        # The followers table already exists as the field's automatic
+        # through table; adopt it as CompanyFollow, then add the cursor
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='CompanyFollow',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='follows', to='business.company')),
+                        ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='company_follows', to=settings.AUTH_USER_MODEL)),
+                    ],
+                    options={
+                        'db_table': 'business_company_followers',
+                        'unique_together': {('company', 'user')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='company',
+                    name='followers',
+                    field=models.ManyToManyField(blank=True, related_name='following_companies', through='business.CompanyFollow', to=settings.AUTH_USER_MODEL),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='companyfollow',
+            name='followed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='companyfollow',
+            name='read_up_to',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='CompanyActivity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('message', models.CharField(max_length=255)),
+                ('link', models.CharField(blank=True, max_length=255, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activities', to='business.company')),
+                ('item', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='business.item')),
+            ],
+            options={
+                'verbose_name_plural': 'Company activities',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['company', '-id'], name='business_activity_stream_idx')],
+            },
+        ),
+    ]
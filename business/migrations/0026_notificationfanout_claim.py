@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 10:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('business', '0025_notification_inbox_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationfanout',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='notificationfanout',
+            name='claimed_by',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 11:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('business', '0026_notificationfanout_claim'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='trending_score',
+            field=models.FloatField(db_index=True, default=0, editable=False),
+        ),
+    ]
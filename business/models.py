@@ -1,12 +1,17 @@
+import copy
+
 from django.db import models
 from django.contrib.auth.models import User
 from django.db.models.signals import post_save
 from django.dispatch import receiver
-from django.core.mail import send_mail
-from django.conf import settings
+from django.urls import reverse
+from django.utils import timezone
 
 # Create your models here.
 
+# Attribute names that hold an item's brand, in order of preference
+BRAND_ATTRIBUTE_NAMES = ['Brand', 'Make', 'Provider', 'Publisher', 'Company']
+
 class Category(models.Model):
     name = models.CharField(max_length=100)
     slug = models.SlugField(unique=True, blank=True)
@@ -60,7 +65,7 @@ class Company(models.Model):
     logo = models.ImageField(upload_to='company_logos/', null=True, blank=True)
     description = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
-    followers = models.ManyToManyField(User, related_name='following_companies', blank=True)
+    followers = models.ManyToManyField(User, through='CompanyFollow', related_name='following_companies', blank=True)
     is_verified = models.BooleanField(default=False)
     address = models.CharField(max_length=255, blank=True, help_text="Physical location of the company")
 
@@ -70,6 +75,22 @@ class Company(models.Model):
     class Meta:
         verbose_name_plural = "Companies"
 
+class CompanyFollow(models.Model):
+    """
+    A user following a company, and their cursor on its activity stream:
+    entries from before ``followed_at`` are not shown to them and entries up
+    to ``read_up_to`` count as read.
+    """
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='follows')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='company_follows')
+    followed_at = models.DateTimeField(default=timezone.now)
+    read_up_to = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        # The table Django created for the plain many-to-many field
+        db_table = 'business_company_followers'
+        unique_together = [('company', 'user')]
+
 class Item(models.Model):
     # --- Global Requirements (Mandatory for ALL Products) ---
     seller = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -125,10 +146,64 @@ class Item(models.Model):
     buyer = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='purchases')
     is_pinned = models.BooleanField(default=False, verbose_name="Pinned to Top")
     views = models.PositiveIntegerField(default=0)
+    # Time-decayed view score, see business.trending
+    trending_score = models.FloatField(default=0, db_index=True, editable=False)
+
+    # Denormalized copy of attribute_values ({attribute name: value}) so
+    # listings and the detail page never have to walk the EAV table.
+    attributes = models.JSONField(default=dict, blank=True, editable=False)
+    brand = models.CharField(max_length=255, blank=True, default='', db_index=True, editable=False)
 
     def __str__(self):
         return self.title
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored values so save handlers can tell what changed
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # post_save handlers have seen the old values; the saved ones are current now
+        self._loaded_values = {
+            field.attname: copy.copy(getattr(self, field.attname))
+            for field in self._meta.concrete_fields
+        }
+
+    def has_changed(self, *fields):
+        """True if any of ``fields`` differs from the value loaded from the database."""
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            return True
+        return any(
+            field in loaded and loaded[field] != getattr(self, field)
+            for field in fields
+        )
+
+    def sync_attributes(self):
+        """Rebuild ``attributes`` and ``brand`` from the ProductAttributeValue rows."""
+        values = self.attribute_values.select_related('attribute').order_by('id')
+        self.attributes = {v.attribute.name: v.value for v in values}
+        self.brand = next(
+            (v.value for v in values if v.attribute.name in BRAND_ATTRIBUTE_NAMES), ''
+        )[:255]
+        self.save(update_fields=['attributes', 'brand'])
+
+class ItemNeighbours(models.Model):
+    """Precomputed "related items" for an item, most similar first."""
+    item = models.OneToOneField(Item, on_delete=models.CASCADE, primary_key=True, related_name='neighbours')
+    neighbour_ids = models.JSONField(default=list)
+    scores = models.JSONField(default=list)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "Item neighbours"
+
+    def __str__(self):
+        return f"Neighbours of item {self.item_id}"
+
 class ProductAttributeValue(models.Model):
     product = models.ForeignKey(Item, related_name='attribute_values', on_delete=models.CASCADE)
     attribute = models.ForeignKey(Attribute, on_delete=models.CASCADE)
@@ -146,10 +221,41 @@ class Notification(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['recipient', 'is_read', 'created_at'], name='business_notification_inbox'),
+        ]
 
     def __str__(self):
         return f"Notification for {self.recipient.username}"
 
+    def get_read_url(self):
+        return reverse('business:mark_notification_read', args=[self.id])
+
+class CompanyActivity(models.Model):
+    """
+    An entry in a company's activity stream. Followers of large companies
+    read these at request time instead of getting a Notification each; see
+    business.notifications.
+    """
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='activities')
+    item = models.ForeignKey('Item', on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    message = models.CharField(max_length=255)
+    link = models.CharField(max_length=255, blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name_plural = "Company activities"
+        indexes = [
+            models.Index(fields=['company', '-id'], name='business_activity_stream_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.company.name}: {self.message}"
+
+    def get_read_url(self):
+        return reverse('business:mark_activity_read', args=[self.id])
+
 class Review(models.Model):
     company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='reviews')
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -180,43 +286,31 @@ class Report(models.Model):
     def __str__(self):
         return f"Report: {self.company.name}"
 
+class NotificationFanout(models.Model):
+    """Progress of telling a company's followers about a new item, see business.fanout."""
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='notification_fanouts')
+    # Followers are handled in id order; the last follower id done per channel
+    notified_up_to = models.PositiveBigIntegerField(default=0)
+    emailed_up_to = models.PositiveBigIntegerField(default=0)
+    # False when the item went to the company's activity stream instead of
+    # one Notification per follower
+    in_app = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # The worker currently running the job; the claim lapses when claimed_at
+    # is not refreshed for NOTIFICATION_FANOUT_CLAIM_TIMEOUT seconds
+    claimed_by = models.CharField(max_length=64, blank=True, default='')
+    claimed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Fan-out for {self.item}"
+
 @receiver(post_save, sender=Item)
 def send_new_item_notification(sender, instance, created, **kwargs):
     """
-    Signal to send email notification to company followers when a new item is posted.
+    Queue notifications for company followers when a new item is posted.
+    business.fanout delivers them after the transaction commits.
     """
     if created and instance.company:
-        followers = instance.company.followers.all()
-        
-        # Create in-app notifications
-        notifications_to_create = []
-        for user in followers:
-            notifications_to_create.append(Notification(
-                recipient=user,
-                message=f"New from {instance.company.name}: {instance.title}",
-                link=f"/item/{instance.id}/"
-            ))
-        Notification.objects.bulk_create(notifications_to_create)
-
-        recipient_list = [user.email for user in followers if user.email]
-        
-        if recipient_list:
-            subject = f"New Product from {instance.company.name}: {instance.title}"
-            # In production, use your actual domain or Django's Site framework
-            item_url = f"http://127.0.0.1:8000/item/{instance.id}/"
-            
-            message = (
-                f"Hello,\n\n"
-                f"{instance.company.name} has just posted a new product: {instance.title}.\n\n"
-                f"Price: {instance.price}\n\n"
-                f"View it here: {item_url}\n\n"
-                f"Best regards,\nU-Connect Team"
-            )
-            
-            send_mail(
-                subject,
-                message,
-                getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@u-connect.com'),
-                recipient_list,
-                fail_silently=True
-            )
+        from . import fanout
+        fanout.enqueue(instance)
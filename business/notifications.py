@@ -0,0 +1,157 @@
+"""
+In-app notifications: a user's own ``Notification`` rows merged with the
+activity streams of the companies they follow.
+
+A new item of a company with fewer than ``NOTIFICATION_FANOUT_THRESHOLD``
+followers is copied into one Notification per follower (fan-out on write,
+``business.fanout``). Larger companies append the item once to their
+``CompanyActivity`` stream instead, and followers merge the streams in when
+they read their notifications (fan-out on read). Each ``CompanyFollow`` row
+is the follower's cursor on one stream.
+
+Unread counts are cached per user together with the stream generation they
+were computed in. Changes to a user's own notifications or follows drop
+their cached count; a new stream entry bumps the generation, which makes
+every cached count stale at once. Counts are recomputed when next needed.
+
+Invalidations only reach other processes through a shared cache, so cached
+counts also expire after ``NOTIFICATION_COUNT_CACHE_TIMEOUT`` seconds; with
+the default per-process cache that bounds how long another worker can show
+a stale badge. ``manage.py repair_notification_counts`` rewrites the cached
+counts of every user and therefore requires a shared cache.
+"""
+import heapq
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Max, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import CompanyActivity, CompanyFollow, Notification
+from .pagination import encode_cursor, keyset_page
+
+FANOUT_THRESHOLD = getattr(settings, 'NOTIFICATION_FANOUT_THRESHOLD', 1000)
+COUNT_TIMEOUT = getattr(settings, 'NOTIFICATION_COUNT_CACHE_TIMEOUT', 60)
+
+UNREAD_KEY = 'notifications:unread:{}'
+STREAM_GENERATION_KEY = 'notifications:stream:generation'
+
+
+def fans_out_on_write(company):
+    return company.follows.count() < FANOUT_THRESHOLD
+
+
+def publish(item):
+    """Append a new item to its company's activity stream."""
+    activity = CompanyActivity.objects.create(
+        company=item.company,
+        item=item,
+        message=f"New from {item.company.name}: {item.title}",
+        link=f"/item/{item.id}/",
+    )
+    transaction.on_commit(bump_stream_generation)
+    return activity
+
+
+def stream_entries(user):
+    """Activity entries visible to ``user``, annotated with ``is_read``."""
+    return CompanyActivity.objects.filter(
+        company__follows__user=user,
+        created_at__gte=F('company__follows__followed_at'),
+    ).annotate(
+        is_read=Q(id__lte=F('company__follows__read_up_to')),
+    ).order_by('-created_at', '-id')
+
+
+def page(user, cursor=None, per_page=20):
+    """
+    Return ``(entries, next_cursor)``: a page of ``user``'s notifications and
+    stream entries, newest first. Both sources are read by keyset from the
+    same cursor and merged, so no page costs more than ``2 * per_page`` rows.
+    """
+    own, own_next = keyset_page(user.notifications.all(), 'newest', cursor, per_page)
+    stream, stream_next = keyset_page(stream_entries(user), 'newest', cursor, per_page)
+    merged = list(heapq.merge(own, stream, key=lambda entry: (entry.created_at, entry.id), reverse=True))
+    entries = merged[:per_page]
+    if len(merged) > per_page or own_next or stream_next:
+        return entries, encode_cursor('newest', entries[-1])
+    return entries, None
+
+
+def _stream_unread(user):
+    unread = CompanyActivity.objects.filter(
+        company_id=OuterRef('company_id'),
+        id__gt=OuterRef('read_up_to'),
+        created_at__gte=OuterRef('followed_at'),
+    ).order_by().values('company_id').annotate(count=Count('id')).values('count')
+    return CompanyFollow.objects.filter(user=user).annotate(
+        unread=Coalesce(Subquery(unread), Value(0))
+    ).aggregate(total=Sum('unread'))['total'] or 0
+
+
+def count_unread(user):
+    """Count ``user``'s unread notifications in the database."""
+    own = Notification.objects.filter(recipient=user, is_read=False).count()
+    return own + _stream_unread(user)
+
+
+def _stream_generation(found):
+    generation = found.get(STREAM_GENERATION_KEY)
+    if generation is None:
+        cache.add(STREAM_GENERATION_KEY, 1, None)
+        generation = cache.get(STREAM_GENERATION_KEY, 1)
+    return generation
+
+
+def unread_count(user):
+    key = UNREAD_KEY.format(user.id)
+    found = cache.get_many([key, STREAM_GENERATION_KEY])
+    generation = _stream_generation(found)
+    cached = found.get(key)
+    if cached is not None and cached[0] == generation:
+        return cached[1]
+    count = count_unread(user)
+    cache.set(key, (generation, count), COUNT_TIMEOUT)
+    return count
+
+
+def cached_counts(user_ids):
+    """Return {user_id: cached unread count} for the users that have one."""
+    keys = {UNREAD_KEY.format(user_id): user_id for user_id in user_ids}
+    return {keys[key]: count for key, (_, count) in cache.get_many(keys).items()}
+
+
+def set_cached_count(user_id, count):
+    generation = _stream_generation(cache.get_many([STREAM_GENERATION_KEY]))
+    cache.set(UNREAD_KEY.format(user_id), (generation, count), COUNT_TIMEOUT)
+
+
+def invalidate(user_ids):
+    cache.delete_many([UNREAD_KEY.format(user_id) for user_id in user_ids])
+
+
+def bump_stream_generation():
+    cache.add(STREAM_GENERATION_KEY, 0, None)
+    try:
+        cache.incr(STREAM_GENERATION_KEY)
+    except ValueError:
+        # Evicted in between; readers notice the reset value as a change
+        cache.set(STREAM_GENERATION_KEY, 1, None)
+
+
+def mark_activity_read(user, activity):
+    """Move the user's cursor on the activity's stream up to ``activity``."""
+    CompanyFollow.objects.filter(
+        user=user, company_id=activity.company_id, read_up_to__lt=activity.id
+    ).update(read_up_to=activity.id)
+    transaction.on_commit(lambda: invalidate([user.id]))
+
+
+def mark_all_read(user):
+    user.notifications.filter(is_read=False).update(is_read=True)
+    latest = CompanyActivity.objects.filter(company_id=OuterRef('company_id')).order_by().values(
+        'company_id'
+    ).annotate(latest=Max('id')).values('latest')
+    CompanyFollow.objects.filter(user=user).update(read_up_to=Coalesce(Subquery(latest), F('read_up_to')))
+    transaction.on_commit(lambda: invalidate([user.id]))
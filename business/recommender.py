@@ -0,0 +1,163 @@
+"""
+Item-to-item "related items" recommender.
+
+Active items are turned into TF-IDF vectors over their title and
+description tokens, category and attribute values. The ``top_k`` most
+cosine-similar items of every item are then stored in ``ItemNeighbours``,
+which ``item_detail`` reads by primary key.
+
+Building needs NumPy and SciPy and runs offline through
+``manage.py rebuild_item_neighbours``. Similarities are computed in row
+chunks, optionally spread over a process pool. Only the web process reads
+the neighbour table, so the scientific stack is not needed there.
+"""
+import math
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from .models import Item, ItemNeighbours
+from .search import tokenize
+
+TITLE_WEIGHT = 2
+
+_matrix = None
+
+
+def item_features(title, description, category_id, attributes):
+    """Return the weighted bag of features describing one item."""
+    features = Counter()
+    for token in tokenize(title):
+        features[f't:{token}'] += TITLE_WEIGHT
+    for token in tokenize(description):
+        features[f't:{token}'] += 1
+    if category_id:
+        features[f'cat:{category_id}'] += TITLE_WEIGHT
+    for name, value in (attributes or {}).items():
+        features[f'attr:{name.lower()}={str(value).lower()}'] += TITLE_WEIGHT
+    return features
+
+
+def build_matrix(rows):
+    """
+    Vectorize ``rows`` of (id, title, description, category_id, attributes).
+
+    Returns ``(item_ids, matrix)`` where ``matrix`` is a CSR matrix with one
+    L2-normalized TF-IDF row per item.
+    """
+    import numpy as np
+    from scipy import sparse
+
+    item_ids = []
+    vocabulary = {}
+    document_frequency = Counter()
+    indptr, indices, counts = [0], [], []
+    for item_id, title, description, category_id, attributes in rows:
+        features = item_features(title, description, category_id, attributes)
+        for feature, count in features.items():
+            column = vocabulary.setdefault(feature, len(vocabulary))
+            indices.append(column)
+            counts.append(count)
+            document_frequency[column] += 1
+        indptr.append(len(indices))
+        item_ids.append(item_id)
+
+    n = len(item_ids)
+    idf = np.ones(len(vocabulary), dtype=np.float32)
+    for column, df in document_frequency.items():
+        idf[column] = math.log((1 + n) / (1 + df)) + 1
+
+    indices = np.asarray(indices, dtype=np.int32)
+    data = (1 + np.log(np.asarray(counts, dtype=np.float32))) * idf[indices]
+    matrix = sparse.csr_matrix((data, indices, np.asarray(indptr)), shape=(n, len(vocabulary)))
+
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    matrix = sparse.diags(1 / norms).dot(matrix).tocsr()
+    return item_ids, matrix
+
+
+def _init_worker(matrix):
+    global _matrix
+    _matrix = matrix
+
+
+def neighbours_for_rows(rows, top_k):
+    """Return ``[(row, [neighbour rows], [scores]), ...]`` for the given matrix rows."""
+    import numpy as np
+
+    similarities = (_matrix[rows] @ _matrix.T).tocsr()
+    result = []
+    for offset, row in enumerate(rows):
+        start, end = similarities.indptr[offset], similarities.indptr[offset + 1]
+        columns = similarities.indices[start:end]
+        scores = similarities.data[start:end]
+        keep = columns != row
+        columns, scores = columns[keep], scores[keep]
+        if len(scores) > top_k:
+            best = np.argpartition(-scores, top_k)[:top_k]
+            columns, scores = columns[best], scores[best]
+        order = np.argsort(-scores, kind='stable')
+        result.append((row, columns[order].tolist(), scores[order].round(4).tolist()))
+    return result
+
+
+def _chunks(rows, size):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def rebuild(top_k=12, chunk_size=256, workers=1, only_missing=False, log=None):
+    """Recompute and store neighbours; returns the number of items updated."""
+    rows = Item.objects.filter(status='active').order_by('id').values_list(
+        'id', 'title', 'description', 'category_obj_id', 'attributes'
+    )
+    item_ids, matrix = build_matrix(rows.iterator(chunk_size=2000))
+    if not item_ids:
+        return 0
+
+    targets = range(len(item_ids))
+    if only_missing:
+        existing = set(ItemNeighbours.objects.values_list('item_id', flat=True))
+        targets = [row for row, item_id in enumerate(item_ids) if item_id not in existing]
+    chunks = list(_chunks(list(targets), chunk_size))
+
+    if workers > 1:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(matrix,))
+        results = executor.map(neighbours_for_rows, chunks, [top_k] * len(chunks))
+    else:
+        _init_worker(matrix)
+        executor = None
+        results = (neighbours_for_rows(chunk, top_k) for chunk in chunks)
+
+    updated = 0
+    try:
+        for chunk_result in results:
+            ItemNeighbours.objects.bulk_create(
+                [
+                    ItemNeighbours(
+                        item_id=item_ids[row],
+                        neighbour_ids=[item_ids[column] for column in columns],
+                        scores=scores,
+                    )
+                    for row, columns, scores in chunk_result
+                ],
+                update_conflicts=True,
+                unique_fields=['item'],
+                update_fields=['neighbour_ids', 'scores', 'updated_at'],
+            )
+            updated += len(chunk_result)
+            if log:
+                log(f'{updated}/{len(targets)} items')
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return updated
+
+
+def related_items(item, k=6):
+    """Return up to ``k`` active neighbours of ``item``, most similar first."""
+    neighbour_ids = ItemNeighbours.objects.filter(pk=item.pk).values_list('neighbour_ids', flat=True).first()
+    if not neighbour_ids:
+        return []
+    found = Item.objects.filter(status='active').in_bulk(neighbour_ids[:k * 2])
+    return [found[item_id] for item_id in neighbour_ids if item_id in found][:k]
@@ -0,0 +1,91 @@
+"""
+Random sampling of featured and related items without ORDER BY RANDOM().
+
+The ids of eligible items are kept in the cache as a compact array. A
+request draws ``k`` ids from it and loads just those rows by primary key,
+so the cost no longer grows with the size of the catalog. The pools are
+dropped by the signals in ``business/signals.py`` whenever pinning, company
+verification, status or category changes, and rebuilt on the next read.
+
+The signals only reach this process's cache, so the drawn rows are loaded
+with the pool's full filter again: an item that stopped qualifying is never
+shown, and one that started qualifying shows up once the pool expires after
+``SAMPLING_POOL_TIMEOUT`` seconds.
+"""
+import random
+from array import array
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Item
+
+FEATURED_POOL_KEY = 'sampling:featured'
+RELATED_POOL_KEY = 'sampling:related:{}'
+POOL_TIMEOUT = getattr(settings, 'SAMPLING_POOL_TIMEOUT', 60)
+
+
+def _pool(key, queryset):
+    ids = cache.get(key)
+    if ids is None:
+        ids = array('q', queryset.values_list('id', flat=True))
+        cache.set(key, ids, POOL_TIMEOUT)
+    return ids
+
+
+def featured_queryset():
+    return Item.objects.filter(
+        status='active',
+        is_pinned=True,
+        company__is_verified=True
+    )
+
+
+def related_queryset(category_id):
+    return Item.objects.filter(
+        category_obj_id=category_id,
+        status='active'
+    )
+
+
+def featured_pool():
+    return _pool(FEATURED_POOL_KEY, featured_queryset())
+
+
+def related_pool(category_id):
+    return _pool(RELATED_POOL_KEY.format(category_id), related_queryset(category_id))
+
+
+def sample_items(pool, k, queryset, exclude=None):
+    """Load ``k`` random items of ``queryset`` whose ids are drawn from ``pool``."""
+    size = len(pool)
+    if exclude is not None:
+        # Draw one spare in case the excluded id comes up
+        k_draw = min(k + 1, size)
+    else:
+        k_draw = min(k, size)
+    picked = [pool[i] for i in random.sample(range(size), k_draw)]
+    picked = [item_id for item_id in picked if item_id != exclude][:k]
+    if not picked:
+        return []
+    found = queryset.in_bulk(picked)
+    return [found[item_id] for item_id in picked if item_id in found]
+
+
+def featured_items(k=8):
+    return sample_items(featured_pool(), k, featured_queryset())
+
+
+def related_items(item, k=6):
+    if item.category_obj_id is None:
+        return []
+    category_id = item.category_obj_id
+    return sample_items(related_pool(category_id), k, related_queryset(category_id), exclude=item.id)
+
+
+def invalidate_featured():
+    cache.delete(FEATURED_POOL_KEY)
+
+
+def invalidate_related(*category_ids):
+    cache.delete_many([RELATED_POOL_KEY.format(c) for c in category_ids if c is not None])
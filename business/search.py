@@ -0,0 +1,244 @@
+"""
+Full-text search over marketplace items.
+
+Each item is indexed as one document made of its title, description,
+category name and attribute values. The index lives in a side table that is
+kept up to date from the signals in ``business/signals.py`` and can be
+rebuilt from scratch with ``manage.py rebuild_search_index``.
+
+The storage is backend specific: SQLite uses an FTS5 virtual table and
+PostgreSQL a ``tsvector`` column with a GIN index. Anything else falls back
+to the old ``icontains`` filter.
+"""
+import re
+
+from django.db import connection, transaction, DatabaseError
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+SEARCH_TABLE = 'business_item_search'
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or '').lower())
+
+
+def no_matches(queryset):
+    return queryset.annotate(search_rank=Value(0.0, output_field=FloatField())).none()
+
+
+def build_document(item):
+    """Return the (title, description, category, attributes) tuple indexed for an item."""
+    category = item.category_obj.name if item.category_obj_id else (item.category or '')
+    attributes = ' '.join(str(value) for value in (item.attributes or {}).values())
+    return (item.title or '', item.description or '', category, attributes)
+
+
+class BaseSearchBackend:
+    available = False
+
+    def index_item(self, item):
+        pass
+
+    def remove_item(self, item_id):
+        pass
+
+    def clear(self):
+        pass
+
+    def search(self, query, limit):
+        """Return up to ``limit`` item ids matching ``query``, best match first."""
+        return []
+
+    def rank(self, queryset, query):
+        """
+        Join ``queryset`` with the index rows matching ``query`` and annotate
+        every item with its ``search_rank``; lower ranks match better.
+        """
+        return no_matches(queryset)
+
+
+class SQLiteSearchBackend(BaseSearchBackend):
+    """FTS5 backed index; the FTS rowid is the item id."""
+
+    available = True
+
+    # bm25() column weights, same order as the FTS5 table columns
+    WEIGHTS = (10.0, 1.0, 4.0, 3.0)
+
+    def index_item(self, item):
+        title, description, category, attributes = build_document(item)
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [item.pk])
+            cursor.execute(
+                f"INSERT INTO {SEARCH_TABLE} (rowid, title, description, category, attributes) "
+                f"VALUES (%s, %s, %s, %s, %s)",
+                [item.pk, title, description, category, attributes],
+            )
+
+    def remove_item(self, item_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [item_id])
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+
+    def match_expression(self, query):
+        # Quote every token so user input can never be parsed as FTS syntax,
+        # and prefix-match the last one for search-as-you-type.
+        tokens = tokenize(query)
+        if not tokens:
+            return None
+        terms = [f'"{token}"' for token in tokens[:-1]]
+        terms.append(f'"{tokens[-1]}"*')
+        return ' '.join(terms)
+
+    def search(self, query, limit):
+        expression = self.match_expression(query)
+        if expression is None:
+            return []
+        weights = ', '.join(str(w) for w in self.WEIGHTS)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s "
+                f"ORDER BY bm25({SEARCH_TABLE}, {weights}) LIMIT %s",
+                [expression, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def rank(self, queryset, query):
+        expression = self.match_expression(query)
+        if expression is None:
+            return no_matches(queryset)
+        weights = ', '.join(str(w) for w in self.WEIGHTS)
+        table = queryset.model._meta.db_table
+        # A join rather than an id list, so the caller's filters apply inside
+        # the full-text query and bm25() is computed once per match
+        return queryset.extra(
+            tables=[SEARCH_TABLE],
+            where=[f"{SEARCH_TABLE}.rowid = {table}.id", f"{SEARCH_TABLE} MATCH %s"],
+            params=[expression],
+        ).annotate(
+            search_rank=RawSQL(f"bm25({SEARCH_TABLE}, {weights})", [], output_field=FloatField())
+        )
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """tsvector backed index, weighted A (title) to D (description)."""
+
+    available = True
+
+    def index_item(self, item):
+        title, description, category, attributes = build_document(item)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {SEARCH_TABLE} (item_id, document) VALUES (%s, "
+                f"setweight(to_tsvector('simple', %s), 'A') || "
+                f"setweight(to_tsvector('simple', %s), 'B') || "
+                f"setweight(to_tsvector('simple', %s), 'C') || "
+                f"setweight(to_tsvector('simple', %s), 'D')) "
+                f"ON CONFLICT (item_id) DO UPDATE SET document = EXCLUDED.document",
+                [item.pk, title, category, attributes, description],
+            )
+
+    def remove_item(self, item_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE item_id = %s", [item_id])
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"TRUNCATE {SEARCH_TABLE}")
+
+    def ts_query(self, query):
+        tokens = tokenize(query)
+        if not tokens:
+            return None
+        return ' & '.join(tokens[:-1] + [f'{tokens[-1]}:*'])
+
+    def search(self, query, limit):
+        expression = self.ts_query(query)
+        if expression is None:
+            return []
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT item_id FROM {SEARCH_TABLE}, to_tsquery('simple', %s) query "
+                f"WHERE document @@ query ORDER BY ts_rank(document, query) DESC LIMIT %s",
+                [expression, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def rank(self, queryset, query):
+        expression = self.ts_query(query)
+        if expression is None:
+            return no_matches(queryset)
+        table = queryset.model._meta.db_table
+        return queryset.extra(
+            tables=[SEARCH_TABLE],
+            where=[
+                f"{SEARCH_TABLE}.item_id = {table}.id",
+                f"{SEARCH_TABLE}.document @@ to_tsquery('simple', %s)",
+            ],
+            params=[expression],
+        ).annotate(
+            search_rank=RawSQL(
+                f"-ts_rank({SEARCH_TABLE}.document, to_tsquery('simple', %s))", [expression],
+                output_field=FloatField(),
+            )
+        )
+
+
+BACKENDS = {
+    'sqlite': SQLiteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_backend():
+    return BACKENDS.get(connection.vendor, BaseSearchBackend)()
+
+
+def index_item(item):
+    try:
+        with transaction.atomic():
+            get_backend().index_item(item)
+    except DatabaseError:
+        # A missing index table must never break saving an item;
+        # rebuild_search_index brings it back in sync.
+        pass
+
+
+def remove_item(item_id):
+    try:
+        with transaction.atomic():
+            get_backend().remove_item(item_id)
+    except DatabaseError:
+        pass
+
+
+def search_items(queryset, query):
+    """
+    Filter ``queryset`` down to items matching ``query``, annotated with a
+    ``search_rank`` (lower = better match) and ordered by it.
+
+    The index is queried together with the caller's filters, so scoped
+    searches such as a company storefront see all of their own matches.
+    """
+    backend = get_backend()
+    ranked = backend.rank(queryset, query) if backend.available else None
+    try:
+        with transaction.atomic():
+            found = ranked is not None and ranked.exists()
+    except DatabaseError:
+        ranked = None
+    if ranked is None:
+        return queryset.filter(Q(title__icontains=query) | Q(description__icontains=query)).annotate(
+            search_rank=Value(0.0, output_field=FloatField())
+        )
+    if not found:
+        # Nothing matches as typed; allow for typos before giving up
+        from . import fuzzy
+        ranked = fuzzy.rank_items(queryset, query)
+    return ranked.order_by('search_rank', 'id')
@@ -0,0 +1,149 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from .models import Item, Company, Category, Attribute, Notification, ProductAttributeValue
+from . import search, fuzzy, notifications
+from .facets import facet_index
+from . import sampling, trending
+from .autocomplete import autocomplete_index
+
+
+@receiver(post_save, sender=Item)
+def index_item_for_search(sender, instance, **kwargs):
+    search.index_item(instance)
+
+@receiver(post_delete, sender=Item)
+def remove_item_from_search(sender, instance, **kwargs):
+    search.remove_item(instance.pk)
+
+@receiver(post_save, sender=Item)
+def index_item_trigrams(sender, instance, created, **kwargs):
+    if created or instance.has_changed('title', 'brand'):
+        fuzzy.index_item(instance)
+
+@receiver(post_delete, sender=Item)
+def remove_item_trigrams(sender, instance, **kwargs):
+    fuzzy.remove(fuzzy.ITEM, instance.pk)
+
+@receiver(post_save, sender=Company)
+def index_company_trigrams(sender, instance, **kwargs):
+    fuzzy.index_company(instance)
+
+@receiver(post_delete, sender=Company)
+def remove_company_trigrams(sender, instance, **kwargs):
+    fuzzy.remove(fuzzy.COMPANY, instance.pk)
+
+@receiver(post_save, sender=Item)
+def update_item_facets(sender, instance, created, **kwargs):
+    if created or instance.has_changed('category_obj_id', 'status', 'attributes'):
+        previous = getattr(instance, '_loaded_values', {}).get('category_obj_id')
+        facet_index.update_item(instance, previous_category_id=previous)
+
+@receiver(post_delete, sender=Item)
+def remove_item_facets(sender, instance, **kwargs):
+    facet_index.remove_item(instance.pk, instance.category_obj_id)
+
+@receiver(post_save, sender=Item)
+def refresh_sampling_pools(sender, instance, created, **kwargs):
+    if created or instance.has_changed('status', 'is_pinned', 'company_id', 'category_obj_id'):
+        loaded = getattr(instance, '_loaded_values', {})
+        if instance.is_pinned or loaded.get('is_pinned'):
+            sampling.invalidate_featured()
+        sampling.invalidate_related(instance.category_obj_id, loaded.get('category_obj_id'))
+
+@receiver(post_delete, sender=Item)
+def drop_from_sampling_pools(sender, instance, **kwargs):
+    if instance.is_pinned:
+        sampling.invalidate_featured()
+    sampling.invalidate_related(instance.category_obj_id)
+
+@receiver(post_save, sender=Company)
+@receiver(post_delete, sender=Company)
+def refresh_featured_pool(sender, instance, **kwargs):
+    # Verification decides whether pinned items are featured
+    sampling.invalidate_featured()
+
+@receiver(post_save, sender=Item)
+def refresh_trending_cards(sender, instance, created, **kwargs):
+    fields = ('title', 'price', 'image', 'status', 'category_obj_id', 'company_id')
+    if not created and instance.has_changed(*fields):
+        loaded = getattr(instance, '_loaded_values', {})
+        trending.refresh_item(
+            instance,
+            previous_category_id=loaded.get('category_obj_id'),
+            previous_company_id=loaded.get('company_id'),
+        )
+
+@receiver(post_delete, sender=Item)
+def remove_from_trending(sender, instance, **kwargs):
+    trending.remove_item(instance)
+
+@receiver(post_save, sender=Item)
+def update_autocomplete(sender, instance, created, **kwargs):
+    if created:
+        autocomplete_index.update_item(instance)
+    elif not hasattr(instance, '_loaded_values'):
+        # Nothing to subtract the old counts with
+        autocomplete_index.invalidate()
+    elif instance.has_changed('title', 'status', 'views', 'brand', 'category_obj_id'):
+        autocomplete_index.update_item(instance, instance._loaded_values)
+
+@receiver(post_delete, sender=Item)
+def remove_from_autocomplete(sender, instance, **kwargs):
+    autocomplete_index.remove_item(instance)
+
+def _sync_attributes_on_commit(item_id):
+    """
+    Refresh the item's denormalized attributes once the transaction commits.
+    Rows saved in the same transaction share one callback, so a form saving
+    a dozen attribute rows syncs each item once.
+    """
+    connection = transaction.get_connection()
+    for _, callback, _ in connection.run_on_commit:
+        if hasattr(callback, 'item_ids'):
+            callback.item_ids.add(item_id)
+            return
+
+    def sync():
+        # Deleted along with the item, or since
+        for item in Item.objects.filter(pk__in=sync.item_ids):
+            item.sync_attributes()
+
+    sync.item_ids = {item_id}
+    transaction.on_commit(sync)
+
+@receiver(post_save, sender=ProductAttributeValue)
+@receiver(post_delete, sender=ProductAttributeValue)
+def sync_item_attributes(sender, instance, **kwargs):
+    _sync_attributes_on_commit(instance.product_id)
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Attribute)
+@receiver(post_delete, sender=Attribute)
+def rebuild_autocomplete(sender, instance, **kwargs):
+    autocomplete_index.invalidate()
+
+@receiver(post_save, sender=Notification)
+def drop_unread_notification_count(sender, instance, **kwargs):
+    transaction.on_commit(lambda: notifications.invalidate([instance.recipient_id]))
+
+@receiver(post_delete, sender=Notification)
+def drop_unread_count_of_deleted(sender, instance, **kwargs):
+    # Read notifications, e.g. the ones compact_notifications removes, never counted
+    if not instance.is_read:
+        transaction.on_commit(lambda: notifications.invalidate([instance.recipient_id]))
+
+@receiver(m2m_changed, sender=Company.followers.through)
+def drop_follower_unread_counts(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        user_ids = [instance.pk]
+    elif action == 'post_clear':
+        # The former followers are unknown by now; drop every count
+        transaction.on_commit(notifications.bump_stream_generation)
+        return
+    else:
+        user_ids = list(pk_set)
+    transaction.on_commit(lambda: notifications.invalidate(user_ids))
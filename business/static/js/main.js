@@ -175,8 +175,7 @@ document.addEventListener('DOMContentLoaded', function() {
             return `<span class="tick-icon ${tickClass}"><svg xmlns="http://www.w3.org/2000/svg" height="16" viewBox="0 0 24 24" width="16">${svgContent}</svg></span>`;
         }
 
-        function appendMessage(msg) {
-            if(document.querySelector(`.message-bubble[data-id="${msg.id}"]`)) return;
+        function buildMessage(msg) {
             const div = document.createElement('div');
             const isSent = msg.sender_id == currentUserId || msg.is_sent;
             div.className = `message-bubble ${isSent ? 'sent' : 'received'}`;
@@ -186,11 +185,54 @@ document.addEventListener('DOMContentLoaded', function() {
             if (isSent) {
                 ticks = getTickHtml(msg.status || 'sent');
             }
-            div.innerHTML = `<div class="message-content">${msg.content}</div><div class="message-time">${msg.timestamp}${ticks}</div>`;
-            messagesContainer.appendChild(div);
+            const image = msg.image_url ? `<img src="${msg.image_url}" alt="Image" class="chat-image">` : '';
+            div.innerHTML = `${image}<div class="message-content">${msg.content}</div><div class="message-time">${msg.timestamp}${ticks}</div>`;
+            return div;
+        }
+
+        function appendMessage(msg) {
+            if(document.querySelector(`.message-bubble[data-id="${msg.id}"]`)) return;
+            messagesContainer.appendChild(buildMessage(msg));
             messagesContainer.scrollTop = messagesContainer.scrollHeight;
         }
 
+        // Older history is fetched a page at a time, by the id of the
+        // oldest message shown, when the user scrolls to the top
+        const historyUrl = messagesContainer.getAttribute('data-history-url');
+        let loadEarlierBtn = document.getElementById('loadEarlierBtn');
+        let loadingEarlier = false;
+
+        function loadEarlier() {
+            if (!loadEarlierBtn || loadingEarlier) return;
+            const firstMsg = messagesContainer.querySelector('.message-bubble');
+            if (!firstMsg) return;
+            loadingEarlier = true;
+            fetch(`${historyUrl}?before=${firstMsg.dataset.id}`)
+            .then(res => res.json())
+            .then(data => {
+                // Keep the messages in view where they are
+                const previousHeight = messagesContainer.scrollHeight;
+                data.messages.forEach(msg => {
+                    if (!document.querySelector(`.message-bubble[data-id="${msg.id}"]`)) {
+                        firstMsg.before(buildMessage(msg));
+                    }
+                });
+                messagesContainer.scrollTop += messagesContainer.scrollHeight - previousHeight;
+                if (!data.has_earlier) {
+                    loadEarlierBtn.remove();
+                    loadEarlierBtn = null;
+                }
+            })
+            .finally(() => { loadingEarlier = false; });
+        }
+
+        if (loadEarlierBtn) {
+            loadEarlierBtn.addEventListener('click', loadEarlier);
+            messagesContainer.addEventListener('scroll', () => {
+                if (messagesContainer.scrollTop < 100) loadEarlier();
+            });
+        }
+
         if (form) {
             form.addEventListener('submit', function(e) {
                 e.preventDefault();
@@ -201,79 +243,166 @@ document.addEventListener('DOMContentLoaded', function() {
             });
         }
 
+        // The partner's read watermark: every message up to it has been read
+        let readUpTo = '';
+        let partnerOnline = false;
+
+        function applyTicks() {
+            messagesContainer.querySelectorAll('.message-bubble.sent').forEach(bubble => {
+                const timeDiv = bubble.querySelector('.message-time');
+                if (!timeDiv || !bubble.dataset.id) return;
+                let status = partnerOnline ? 'delivered' : 'sent';
+                if (readUpTo !== '' && Number(bubble.dataset.id) <= readUpTo) status = 'read';
+                const existingTick = timeDiv.querySelector('.tick-icon');
+                if(existingTick) existingTick.remove();
+                timeDiv.insertAdjacentHTML('beforeend', getTickHtml(status));
+            });
+        }
+
         if (getMessagesUrl) {
-            const fetchMessages = () => {
+            const lastMessageId = () => {
                 const lastMsg = messagesContainer.querySelector('.message-bubble:last-child');
                 // Ensure lastId is valid; if data-id is missing/undefined, default to 0 to prevent server errors
-                const lastId = (lastMsg && lastMsg.dataset.id) ? lastMsg.dataset.id : 0;
-                fetch(`${getMessagesUrl}?last_id=${lastId}`)
-                .then(res => res.json())
-                .then(data => { 
-                    if(data.messages && data.messages.length > 0) {
-                        data.messages.forEach(msg => appendMessage(msg)); 
-                    }
-                    if(data.statuses) {
-                        data.statuses.forEach(st => {
-                            const bubble = document.querySelector(`.message-bubble[data-id="${st.id}"]`);
-                            if (bubble && bubble.classList.contains('sent')) {
-                                const timeDiv = bubble.querySelector('.message-time');
-                                if (timeDiv) {
-                                    const existingTick = timeDiv.querySelector('.tick-icon');
-                                    if(existingTick) existingTick.remove();
-                                    timeDiv.insertAdjacentHTML('beforeend', getTickHtml(st.status));
-                                }
-                            }
-                        });
-                    }
-                    
-                    // Update Header Status (Online/Offline)
-                    if (data.partner) {
-                        const header = document.querySelector('.chat-room-header');
-                        if (header) {
-                            // Check if we need to restructure header for the new layout
-                            let userContainer = header.querySelector('.header-user-container');
-                            if (!userContainer) {
-                                // Get existing elements
-                                const backBtn = header.querySelector('.back-btn');
-                                const nameEl = header.querySelector('.chat-username');
-                                const nameText = nameEl ? nameEl.textContent : data.partner.name;
-                                
-                                // Create new structure
-                                if (nameEl) nameEl.remove();
-                                
-                                const avatarUrl = data.partner.avatar || 'https://ui-avatars.com/api/?name=' + encodeURIComponent(nameText) + '&background=random';
-                                
-                                const html = `
-                                    <div class="header-user-container">
-                                        <img src="${avatarUrl}" class="header-profile-pic" alt="Profile">
-                                        <div class="chat-username">${nameText}</div>
-                                        <div class="header-status">
-                                            <span class="status-dot ${data.partner.is_online ? 'online' : 'offline'}"></span>
-                                            <span class="status-text">${data.partner.is_online ? 'Active' : 'Inactive'}</span>
-                                        </div>
+                return (lastMsg && lastMsg.dataset.id) ? lastMsg.dataset.id : 0;
+            };
+
+            let unreadCount = '';
+            const handleUpdate = (data) => {
+                if(data.messages && data.messages.length > 0) {
+                    data.messages.forEach(msg => appendMessage(msg)); 
+                }
+                if (data.partner) {
+                    partnerOnline = !!data.partner.is_online;
+                }
+                if (data.read_up_to !== undefined) {
+                    readUpTo = data.read_up_to;
+                }
+                applyTicks();
+                
+                // Update Header Status (Online/Offline)
+                if (data.partner) {
+                    const header = document.querySelector('.chat-room-header');
+                    if (header) {
+                        // Check if we need to restructure header for the new layout
+                        let userContainer = header.querySelector('.header-user-container');
+                        if (!userContainer) {
+                            // Get existing elements
+                            const backBtn = header.querySelector('.back-btn');
+                            const nameEl = header.querySelector('.chat-username');
+                            const nameText = nameEl ? nameEl.textContent : data.partner.name;
+                            
+                            // Create new structure
+                            if (nameEl) nameEl.remove();
+                            
+                            const avatarUrl = data.partner.avatar || 'https://ui-avatars.com/api/?name=' + encodeURIComponent(nameText) + '&background=random';
+                            
+                            const html = `
+                                <div class="header-user-container">
+                                    <img src="${avatarUrl}" class="header-profile-pic" alt="Profile">
+                                    <div class="chat-username">${nameText}</div>
+                                    <div class="header-status">
+                                        <span class="status-dot ${data.partner.is_online ? 'online' : 'offline'}"></span>
+                                        <span class="status-text">${data.partner.is_online ? 'Active' : 'Inactive'}</span>
                                     </div>
-                                `;
-                                if (backBtn) backBtn.insertAdjacentHTML('afterend', html);
-                            } else {
-                                // Just update status
-                                const dot = header.querySelector('.status-dot');
-                                const text = header.querySelector('.status-text');
-                                if (dot) {
-                                    dot.className = `status-dot ${data.partner.is_online ? 'online' : 'offline'}`;
-                                }
-                                if (text) {
-                                    text.textContent = data.partner.is_online ? 'Active' : 'Inactive';
-                                }
+                                </div>
+                            `;
+                            if (backBtn) backBtn.insertAdjacentHTML('afterend', html);
+                        } else {
+                            // Just update status
+                            const dot = header.querySelector('.status-dot');
+                            const text = header.querySelector('.status-text');
+                            if (dot) {
+                                dot.className = `status-dot ${data.partner.is_online ? 'online' : 'offline'}`;
+                            }
+                            if (text) {
+                                text.textContent = data.partner.is_online ? 'Active' : 'Inactive';
                             }
                         }
                     }
+                }
+                if (data.is_typing) {
+                    document.dispatchEvent(new CustomEvent('chat:typing', { detail: data }));
+                }
+                if (data.unread !== undefined) {
+                    unreadCount = data.unread;
+                    showUnreadCount(data.unread);
+                }
+            };
+
+            const fetchMessages = () => {
+                fetch(`${getMessagesUrl}?last_id=${lastMessageId()}&read_up_to=${readUpTo}`)
+                .then(res => res.json())
+                .then(handleUpdate);
+            };
+
+            // Long polling is the fallback while no WebSocket is connected:
+            // the server answers as soon as something changes
+            const waitUrl = messagesContainer.getAttribute('data-wait-url');
+            let version = '';
+            let polling = false;
+            const poll = () => {
+                if (window.chatSocket) {
+                    polling = false;
+                    window.chatLongPoll = false;
+                    return;
+                }
+                fetch(`${waitUrl}?last_id=${lastMessageId()}&version=${version}&read_up_to=${readUpTo}&unread=${unreadCount}`)
+                .then(res => res.json())
+                .then(data => {
+                    handleUpdate(data);
+                    version = data.version;
+                    poll();
+                })
+                .catch(err => {
+                    console.log('Error waiting for messages:', err);
+                    setTimeout(poll, 5000);
                 });
             };
-            
+            const startPolling = () => {
+                if (polling) return;
+                polling = true;
+                window.chatLongPoll = true;
+                poll();
+            };
+
+            const wsPath = messagesContainer.getAttribute('data-ws-path');
+            let reconnectDelay = 1000;
+            const connectSocket = () => {
+                const scheme = window.location.protocol === 'https:' ? 'wss' : 'ws';
+                const socket = new WebSocket(`${scheme}://${window.location.host}${wsPath}`);
+
+                socket.addEventListener('open', () => {
+                    window.chatSocket = socket;
+                    reconnectDelay = 1000;
+                    // Catch up on anything sent while we were polling
+                    fetchMessages();
+                });
+                socket.addEventListener('message', (e) => {
+                    const data = JSON.parse(e.data);
+                    if (data.type === 'message') {
+                        appendMessage(data.message);
+                    } else if (data.type === 'read') {
+                        readUpTo = data.last_read_id;
+                        applyTicks();
+                    } else if (data.type === 'presence') {
+                        // Refreshes the header and delivery ticks
+                        fetchMessages();
+                    } else if (data.type === 'typing') {
+                        document.dispatchEvent(new CustomEvent('chat:typing', { detail: data }));
+                    }
+                });
+                socket.addEventListener('close', () => {
+                    window.chatSocket = null;
+                    startPolling();
+                    setTimeout(connectSocket, reconnectDelay);
+                    reconnectDelay = Math.min(reconnectDelay * 2, 60000);
+                });
+            };
+
             // Run immediately to update existing messages
             fetchMessages();
-            // Poll every 2 seconds
-            setInterval(fetchMessages, 2000);
+            startPolling();
+            if (wsPath && 'WebSocket' in window) connectSocket();
         }
     }
 
@@ -310,29 +439,33 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 
     // --- Global: Unread Messages Badge ---
+    function showUnreadCount(count) {
+        // Find chat link in navbar - assuming it contains 'chat' or 'inbox' in href
+        const chatLinks = document.querySelectorAll('a[href*="/chat/"]');
+        chatLinks.forEach(link => {
+            let badge = link.querySelector('.nav-badge');
+            if (count > 0) {
+                if (!badge) {
+                    badge = document.createElement('span');
+                    badge.className = 'nav-badge';
+                    link.appendChild(badge);
+                    link.style.position = 'relative'; // Ensure positioning context
+                }
+                badge.textContent = count;
+                badge.style.display = 'flex';
+            } else if (badge) {
+                badge.style.display = 'none';
+            }
+        });
+    }
+
     function updateUnreadCount() {
-        fetch('/chat/api/unread/')
+        // An open chat room's long poll carries the count already
+        if (window.chatLongPoll) return;
+        // Revalidated with If-None-Match; an unchanged count comes back as 304
+        fetch('/chat/total_unread/')
             .then(response => response.json())
-            .then(data => {
-                const count = data.count;
-                // Find chat link in navbar - assuming it contains 'chat' or 'inbox' in href
-                const chatLinks = document.querySelectorAll('a[href*="/chat/"]');
-                chatLinks.forEach(link => {
-                    let badge = link.querySelector('.nav-badge');
-                    if (count > 0) {
-                        if (!badge) {
-                            badge = document.createElement('span');
-                            badge.className = 'nav-badge';
-                            link.appendChild(badge);
-                            link.style.position = 'relative'; // Ensure positioning context
-                        }
-                        badge.textContent = count;
-                        badge.style.display = 'flex';
-                    } else if (badge) {
-                        badge.style.display = 'none';
-                    }
-                });
-            })
+            .then(data => showUnreadCount(data.count))
             .catch(err => console.log('Error fetching unread count:', err));
     }
     
@@ -506,17 +639,67 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     });
 
+    // --- Search Suggestions ---
+    const suggestForm = document.querySelector('.search-form[data-suggest-url]');
+    if (suggestForm) {
+        const input = suggestForm.querySelector('.search-input');
+        const list = suggestForm.querySelector('.search-suggestions');
+        const suggestUrl = suggestForm.getAttribute('data-suggest-url');
+        let timer = null;
+        let latest = 0;
+
+        const escapeHtml = (text) => {
+            const div = document.createElement('div');
+            div.textContent = text;
+            return div.innerHTML;
+        };
+
+        input.addEventListener('input', () => {
+            clearTimeout(timer);
+            const query = input.value.trim();
+            if (!query) {
+                list.classList.remove('active');
+                return;
+            }
+            timer = setTimeout(() => {
+                const request = ++latest;
+                fetch(`${suggestUrl}?q=${encodeURIComponent(query)}`)
+                .then(res => res.json())
+                .then(data => {
+                    // Ignore answers to keystrokes that were typed over
+                    if (request !== latest) return;
+                    list.innerHTML = data.suggestions.map(s =>
+                        `<a class="custom-option" href="${s.url}">${escapeHtml(s.text)}<span class="search-suggestion-kind">${s.kind}</span></a>`
+                    ).join('');
+                    list.classList.toggle('active', data.suggestions.length > 0);
+                })
+                .catch(err => console.log('Error fetching suggestions:', err));
+            }, 150);
+        });
+
+        document.addEventListener('click', (e) => {
+            if (!suggestForm.contains(e.target)) list.classList.remove('active');
+        });
+    }
+
     // --- Load More Items (AJAX) ---
     const loadMoreBtn = document.getElementById('load-more-btn');
     if (loadMoreBtn) {
         loadMoreBtn.addEventListener('click', function() {
             const btn = this;
             const page = btn.getAttribute('data-page');
+            const cursor = btn.getAttribute('data-cursor');
             const container = document.getElementById('items-grid');
             
             // Construct URL with existing params
             const urlParams = new URLSearchParams(window.location.search);
-            urlParams.set('page', page);
+            if (cursor) {
+                // Keyset pagination: continue after the last item shown
+                urlParams.delete('page');
+                urlParams.set('cursor', cursor);
+            } else {
+                urlParams.set('page', page);
+            }
             const url = `${window.location.pathname}?${urlParams.toString()}`;
 
             btn.disabled = true;
@@ -534,6 +717,7 @@ document.addEventListener('DOMContentLoaded', function() {
                     
                     if (data.has_next) {
                         btn.setAttribute('data-page', parseInt(page) + 1);
+                        if (data.next_cursor) btn.setAttribute('data-cursor', data.next_cursor);
                         btn.disabled = false;
                         btn.textContent = 'Load More';
                     } else {
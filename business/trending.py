@@ -0,0 +1,204 @@
+"""
+Time-decayed trending leaderboards.
+
+Every view adds ``exp(DECAY * t)`` to an item's score, so a view loses half
+its weight every ``TRENDING_HALF_LIFE_HOURS``. Scores are kept as natural
+logs measured from a fixed epoch; since every score decays by the same
+factor, old entries never need to be rewritten and comparing the stored
+numbers always gives the current order.
+
+The top ``LEADERBOARD_SIZE`` items are kept in the cache per board (global,
+per category, per company and per seller) together with a small display
+card, so the trending strips render without querying the item table.
+
+The cache only holds what this process has seen, so scores are also stored
+in ``Item.trending_score`` when the view counter flushes its batches, and
+every board is reseeded from that column once it is
+``TRENDING_BOARD_MAX_AGE`` seconds old. Boards of different processes
+therefore agree up to that age plus the flush interval.
+"""
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+HALF_LIFE = getattr(settings, 'TRENDING_HALF_LIFE_HOURS', 24) * 3600
+DECAY = math.log(2) / HALF_LIFE
+EPOCH = 1735689600  # 2025-01-01 UTC
+
+LEADERBOARD_SIZE = 50
+SCORE_KEY = 'trending:score:{}'
+BOARD_KEY = 'trending:board:{}'
+BOARD_MAX_AGE = getattr(settings, 'TRENDING_BOARD_MAX_AGE', 60)
+
+# A score this many half-lives old is noise; let the cache forget it
+SCORE_TIMEOUT = int(HALF_LIFE * 10)
+
+
+def _logaddexp(a, b):
+    high, low = max(a, b), min(a, b)
+    return high + math.log1p(math.exp(low - high))
+
+
+def _view_weight(timestamp):
+    return DECAY * (timestamp - EPOCH)
+
+
+def _boards(category_id, company_id, seller_id=None):
+    boards = ['global']
+    if category_id:
+        boards.append(f'category:{category_id}')
+    if company_id:
+        boards.append(f'company:{company_id}')
+    if seller_id:
+        boards.append(f'seller:{seller_id}')
+    return boards
+
+
+def boards_for(item):
+    return _boards(item.category_obj_id, item.company_id, item.seller_id)
+
+
+def card(item):
+    return {
+        'id': item.pk,
+        'title': item.title,
+        'price': str(item.price),
+        'image_url': item.image.url if item.image else '',
+        'views': item.views,
+        'status': item.status,
+    }
+
+
+def _stored_score(item):
+    if item.trending_score:
+        return item.trending_score
+    # Never flushed since scores were stored: lifetime views count as if
+    # they happened one half-life ago
+    return _view_weight(time.time() - HALF_LIFE) + math.log1p(item.views)
+
+
+def _seed(board):
+    """Fill a board from the stored scores, when it is missing or too old."""
+    from .models import Item
+
+    items = Item.objects.filter(status='active')
+    kind, _, object_id = board.partition(':')
+    if kind == 'category':
+        items = items.filter(category_obj_id=object_id)
+    elif kind == 'company':
+        items = items.filter(company_id=object_id)
+    elif kind == 'seller':
+        items = items.filter(seller_id=object_id)
+
+    entries = [
+        [_stored_score(item), card(item)]
+        for item in items.order_by('-trending_score', '-views')[:LEADERBOARD_SIZE]
+    ]
+    entries.sort(key=lambda e: e[0], reverse=True)
+    _store(board, time.time(), entries)
+    return entries
+
+
+def _store(board, seeded_at, entries):
+    timeout = max(1, int(seeded_at + BOARD_MAX_AGE - time.time()))
+    cache.set(BOARD_KEY.format(board), (seeded_at, entries), timeout)
+
+
+def _cached_board(board):
+    """Return ``(seeded_at, entries)``, or None if the board has expired."""
+    return cache.get(BOARD_KEY.format(board))
+
+
+def _get_board(board):
+    cached = _cached_board(board)
+    if cached is None:
+        return _seed(board)
+    return cached[1]
+
+
+def _put(board, item_id, score, entry):
+    """Insert, move or (with ``entry=None``) drop an item on ``board``."""
+    cached = _cached_board(board)
+    if entry is None and (cached is None or all(e[1]['id'] != item_id for e in cached[1])):
+        return
+    if cached is None:
+        _seed(board)
+        cached = _cached_board(board)
+        if cached is None:
+            return
+    seeded_at, entries = cached
+    entries = [e for e in entries if e[1]['id'] != item_id]
+    if entry is not None:
+        entries.append([score, entry])
+        entries.sort(key=lambda e: e[0], reverse=True)
+        del entries[LEADERBOARD_SIZE:]
+    # Keeps the seeding time, so busy boards are reseeded all the same
+    _store(board, seeded_at, entries)
+
+
+def record_view(item, timestamp=None):
+    """Add one view of ``item`` to its score and leaderboards."""
+    weight = _view_weight(timestamp or time.time())
+    key = SCORE_KEY.format(item.pk)
+    previous = cache.get(key)
+    # The stored score also holds the views flushed by other processes
+    if item.trending_score and (previous is None or item.trending_score > previous):
+        previous = item.trending_score
+    score = weight if previous is None else _logaddexp(previous, weight)
+    cache.set(key, score, SCORE_TIMEOUT)
+
+    entry = card(item)
+    for board in boards_for(item):
+        entries = _get_board(board)
+        # Skip the write if the item cannot make this board
+        if len(entries) >= LEADERBOARD_SIZE and score <= entries[-1][0] \
+                and all(e[1]['id'] != item.pk for e in entries):
+            continue
+        _put(board, item.pk, score, entry)
+
+
+def refresh_item(item, previous_category_id=None, previous_company_id=None):
+    """Update or drop ``item``'s cards after it was edited, sold or moved."""
+    boards = boards_for(item)
+    for board in set(_boards(previous_category_id, previous_company_id)) - set(boards):
+        _put(board, item.pk, None, None)
+    for board in boards:
+        cached = _cached_board(board)
+        entries = cached[1] if cached else []
+        current = next((e for e in entries if e[1]['id'] == item.pk), None)
+        if current is None:
+            continue
+        if item.status == 'active':
+            _put(board, item.pk, current[0], card(item))
+        else:
+            _put(board, item.pk, None, None)
+
+
+def store_views(counts, timestamp=None):
+    """
+    Add ``counts`` ({item id: views}) to the stored scores; called by the
+    view counter when it writes a batch, inside its transaction.
+    """
+    from .models import Item
+
+    weight = _view_weight(timestamp or time.time())
+    items = []
+    for item_id, stored in Item.objects.filter(id__in=counts).values_list('id', 'trending_score'):
+        score = weight + math.log(counts[item_id])
+        if stored:
+            score = _logaddexp(stored, score)
+        items.append(Item(id=item_id, trending_score=score))
+    Item.objects.bulk_update(items, ['trending_score'], batch_size=500)
+
+
+def remove_item(item):
+    for board in boards_for(item):
+        _put(board, item.pk, None, None)
+    cache.delete(SCORE_KEY.format(item.pk))
+
+
+def top(board='global', limit=8):
+    """Return the display cards of the ``limit`` hottest items on ``board``."""
+    return [entry for _, entry in _get_board(board)[:limit]]
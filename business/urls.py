@@ -5,6 +5,7 @@ app_name = 'business'
 
 urlpatterns = [
     path('', views.home, name='home'),
+    path('search/suggest/', views.search_suggestions, name='search_suggestions'),
     path('about/', views.about, name='about'),
     path('contact/', views.contact, name='contact'),
     path('documentation/', views.documentation, name='documentation'),
@@ -24,6 +25,7 @@ urlpatterns = [
     path('notifications/', views.notifications_view, name='user_notifications'),
     path('notifications/read/all/', views.mark_all_notifications_read, name='mark_all_notifications_read'),
     path('notifications/read/<int:notification_id>/', views.mark_notification_read, name='mark_notification_read'),
+    path('notifications/activity/<int:activity_id>/read/', views.mark_activity_read, name='mark_activity_read'),
     path('company/<int:company_id>/review/', views.add_review, name='add_review'),
     path('review/edit/<int:review_id>/', views.edit_review, name='edit_review'),
     path('review/delete/<int:review_id>/', views.delete_review, name='delete_review'),
@@ -1,12 +1,23 @@
+from urllib.parse import urlencode
+
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required
-from django.db.models import Q, Subquery, OuterRef, Avg, F, Count, Sum
+from django.db.models import Avg, Count, Sum
 from django.utils import timezone
 from django.core.paginator import Paginator
 from django.http import JsonResponse
 from django.template.loader import render_to_string
 from .forms import ItemForm, CompanyForm, ReviewForm, ReportForm, CommentForm
-from .models import Item, Category, ProductAttributeValue, Company, Notification, Review, Report, Comment
+from .models import Item, Category, Company, CompanyActivity, Notification, Review, Report, Comment
+from .search import search_items
+from . import sampling, trending, recommender
+from . import notifications as notification_center
+from .counters import view_counter
+from .autocomplete import autocomplete_index
+from .facets import facet_index, parse_selections, facet_groups
+from .feed import feed_page
+from .pagination import get_ordering, keyset_page, encode_cursor, InvalidCursor
 
 # Create your views here.
 
@@ -15,7 +26,7 @@ def home(request):
     category_id = request.GET.get('category')
     browse_mode = request.GET.get('browse')
     page_number = request.GET.get('page', 1)
-    sort_by = request.GET.get('sort', 'newest')
+    sort_by = request.GET.get('sort') or ('relevance' if query else 'recommended')
     reset = request.GET.get('reset')
 
     if reset:
@@ -29,17 +40,15 @@ def home(request):
     recently_viewed = None
     categories = None
     current_category = None
+    facets = None
     is_home_feed = False
 
     # 1. Search
     if query:
         # Save search query to session for recommendations
         request.session['last_search'] = query
-        # Search functionality
-        items = Item.objects.filter(
-            Q(title__icontains=query) | 
-            Q(description__icontains=query)
-        ).select_related('category_obj')
+        # Full-text search, ranked by relevance
+        items = search_items(Item.objects.select_related('category_obj'), query)
     
     # 2. Category Filter
     elif category_id:
@@ -50,9 +59,17 @@ def home(request):
         # Check if it has children (Subcategories)
         children = category.children.all()
         
-        # Fetch items from this category and its children
+        # Fetch active items from this category and its children, the same
+        # set the facet counts are computed over
         cat_ids = [category.id] + [c.id for c in children]
-        items = Item.objects.filter(category_obj_id__in=cat_ids).select_related('category_obj')
+        items = Item.objects.filter(category_obj_id__in=cat_ids, status='active').select_related('category_obj')
+
+        # Attribute facets (?facet=RAM:8GB&facet=Storage:128GB)
+        facet_selections = parse_selections(request.GET.getlist('facet'))
+        facet_ids, facet_counts = facet_index.search(cat_ids, facet_selections)
+        if facet_ids is not None:
+            items = items.filter(id__in=facet_ids)
+        facets = facet_groups(facet_counts, facet_selections)
 
         if children.exists():
             categories = children
@@ -88,14 +105,10 @@ def home(request):
         items = Item.objects.filter(status='active')
         
         # Featured Items (Pinned items from verified companies)
-        featured_items = Item.objects.filter(
-            status='active',
-            is_pinned=True,
-            company__is_verified=True
-        ).order_by('?')[:8]
+        featured_items = sampling.featured_items(8)
         
-        # Trending Items (Most viewed)
-        trending_items = Item.objects.filter(status='active').order_by('-views')[:8]
+        # Trending Items (time-decayed views, served from the cache)
+        trending_items = trending.top('global', 8)
         
         # Recently Viewed Items (From Session)
         viewed_ids = request.session.get('viewed_items', [])
@@ -108,38 +121,55 @@ def home(request):
 
     # Apply Sorting
     if items is not None:
-        if sort_by == 'price_asc':
-            items = items.order_by('price')
-        elif sort_by == 'price_desc':
-            items = items.order_by('-price')
-        elif sort_by == 'oldest':
-            items = items.order_by('created_at')
-        elif sort_by == 'brand_asc':
-            # Sort by Brand/Make attribute
-            items = items.annotate(
-                brand_name=Subquery(
-                    ProductAttributeValue.objects.filter(
-                        product=OuterRef('pk'),
-                        attribute__name__in=['Brand', 'Make', 'Provider', 'Publisher', 'Company']
-                    ).values('value')[:1]
-                )
-            ).order_by('brand_name')
-        else: # newest (default)
-            items = items.order_by('-created_at')
+        if (sort_by == 'relevance' and not query) or (sort_by == 'recommended' and not is_home_feed):
+            sort_by = 'newest'
+        if sort_by != 'recommended':
+            items = items.order_by(*get_ordering(sort_by))
 
     # Pagination Logic (Only if items are present)
     if items is not None:
-        paginator = Paginator(items, 12) # 12 items per page
-        items_page = paginator.get_page(page_number)
-
-        if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+        is_ajax = request.headers.get('x-requested-with') == 'XMLHttpRequest'
+        cursor = request.GET.get('cursor')
+        personalized = sort_by == 'recommended' and str(page_number) == '1'
+
+        # Infinite scroll: keyset pagination, no COUNT(*) and no OFFSET
+        if is_ajax and cursor:
+            try:
+                if sort_by == 'recommended':
+                    page_items, next_cursor = feed_page(request, items, cursor, per_page=12)
+                else:
+                    page_items, next_cursor = keyset_page(items, sort_by, cursor, per_page=12)
+            except InvalidCursor as e:
+                return JsonResponse({'error': str(e)}, status=400)
+            html = render_to_string('business/partials/items_list.html', {'items': page_items})
+            return JsonResponse({'html': html, 'has_next': next_cursor is not None, 'next_cursor': next_cursor})
+
+        if personalized:
+            # First page of the personalized feed; later pages come by cursor
+            items_page, next_cursor = feed_page(request, items, per_page=12)
+        else:
+            # Page-number mode (first render and non-JS fallback)
+            if sort_by == 'recommended':
+                items = items.order_by(*get_ordering('newest'))
+            paginator = Paginator(items, 12) # 12 items per page
+            items_page = paginator.get_page(page_number)
+            next_cursor = None
+            if items_page.has_next() and sort_by != 'recommended':
+                next_cursor = encode_cursor(sort_by, items_page[-1])
+
+        has_next = next_cursor is not None if personalized else items_page.has_next()
+
+        if is_ajax:
             html = render_to_string('business/partials/items_list.html', {'items': items_page})
-            return JsonResponse({'html': html, 'has_next': items_page.has_next()})
+            return JsonResponse({'html': html, 'has_next': has_next, 'next_cursor': next_cursor})
 
         return render(request, 'business/home.html', {
             'items': items_page, 
+            'has_next': has_next,
+            'next_cursor': next_cursor,
             'search_query': query, 
             'current_category': current_category,
+            'facets': facets,
             'is_home_feed': is_home_feed,
             'sort_by': sort_by,
             'featured_items': featured_items,
@@ -150,6 +180,20 @@ def home(request):
     # Fallback for categories view
     return render(request, 'business/home.html', {'categories': categories, 'current_category': current_category})
 
+def search_suggestions(request):
+    suggestions = []
+    for suggestion in autocomplete_index.suggest(request.GET.get('q', '')):
+        if suggestion['kind'] == 'category':
+            params = {'category': suggestion['category_id']}
+        else:
+            params = {'q': suggestion['text']}
+        suggestions.append({
+            'text': suggestion['text'],
+            'kind': suggestion['kind'],
+            'url': f"{reverse('business:home')}?{urlencode(params)}",
+        })
+    return JsonResponse({'suggestions': suggestions})
+
 def about(request):
     return render(request, 'business/about.html')
 
@@ -215,19 +259,22 @@ def item_detail(request, item_id):
     # Track unique views using session to prevent spamming
     viewed_items = request.session.get('viewed_items', [])
 
-    if item_id not in viewed_items and request.user != item.seller:
-        item.views = F('views') + 1
-        item.save(update_fields=['views'])
-        item.refresh_from_db()
+    is_new_view = item_id not in viewed_items and request.user != item.seller
+
+    if is_new_view:
+        # Buffered in the cache and written to the database in batches
+        view_counter.increment(item.id)
         viewed_items.append(item_id)
         request.session['viewed_items'] = viewed_items
+
+    # Stored count plus increments that have not been flushed yet
+    item.views += view_counter.pending(item.id)
+    if is_new_view:
+        trending.record_view(item)
     
     # Recommendation Logic (Machine Learning / Heuristic)
-    # Filter by same category, exclude current item, random order
-    related_items = Item.objects.filter(
-        category_obj=item.category_obj, 
-        status='active'
-    ).exclude(id=item.id).order_by('?')[:6]
+    # Precomputed TF-IDF neighbours; random same-category sample until they exist
+    related_items = recommender.related_items(item, 6) or sampling.related_items(item, 6)
     
     # Comments Logic
     comments = item.comments.all().order_by('-created_at')
@@ -332,8 +379,12 @@ def company_dashboard(request):
     status_labels = [x['status'].title() for x in status_counts]
     status_data = [x['count'] for x in status_counts]
 
-    # Trending (Top Viewed)
-    trending_items = items.order_by('-views')[:5]
+    # Trending (time-decayed views, served from the cache). The leaderboard
+    # knows nothing about dates, so a date range falls back to the filtered items.
+    if start_date_str or end_date_str:
+        trending_items = [trending.card(item) for item in items.order_by('-views')[:5]]
+    else:
+        trending_items = trending.top(f'company:{company.id}', 5)
     
     # Recent Reviews
     recent_reviews = company.reviews.all().order_by('-created_at')[:5]
@@ -404,8 +455,8 @@ def personal_dashboard(request):
     status_labels = [x['status'].title() for x in status_counts]
     status_data = [x['count'] for x in status_counts]
 
-    # Trending (Top Viewed)
-    trending_items = items.order_by('-views')[:5]
+    # Trending (time-decayed views, served from the cache)
+    trending_items = trending.top(f'seller:{request.user.id}', 5)
     
     context = {
         'items': items,
@@ -444,10 +495,7 @@ def view_company_profile(request, company_id):
 
     query = request.GET.get('q')
     if query:
-        items_qs = items_qs.filter(
-            Q(title__icontains=query) | 
-            Q(description__icontains=query)
-        )
+        items_qs = search_items(items_qs, query)
     
     paginator = Paginator(items_qs, 12) # Show 12 items per page
     page_number = request.GET.get('page')
@@ -486,8 +534,16 @@ def toggle_follow_company(request, company_id):
 
 @login_required
 def notifications_view(request):
-    notifications = request.user.notifications.all()
-    return render(request, 'business/notifications.html', {'notifications': notifications})
+    cursor = request.GET.get('cursor')
+    try:
+        notifications, next_cursor = notification_center.page(request.user, cursor)
+    except InvalidCursor:
+        return redirect('business:user_notifications')
+    return render(request, 'business/notifications.html', {
+        'notifications': notifications,
+        'next_cursor': next_cursor,
+        'is_first_page': not cursor,
+    })
 
 @login_required
 def mark_notification_read(request, notification_id):
@@ -500,7 +556,15 @@ def mark_notification_read(request, notification_id):
 
 @login_required
 def mark_all_notifications_read(request):
-    request.user.notifications.filter(is_read=False).update(is_read=True)
+    notification_center.mark_all_read(request.user)
+    return redirect('business:user_notifications')
+
+@login_required
+def mark_activity_read(request, activity_id):
+    activity = get_object_or_404(CompanyActivity, id=activity_id, company__follows__user=request.user)
+    notification_center.mark_activity_read(request.user, activity)
+    if activity.link:
+        return redirect(activity.link)
     return redirect('business:user_notifications')
 
 @login_required
@@ -0,0 +1,115 @@
+"""
+Cold storage for old chat messages.
+
+``archive_chat_messages`` moves messages older than
+``CHAT_ARCHIVE_AFTER_DAYS`` out of ``Message`` into ``MessageArchive`` rows,
+one per conversation and month, each holding that month's messages as
+zlib-compressed JSON. Only messages every participant has read are
+archived, so unread counts never need them, and the newest message of a
+conversation stays behind for its inbox preview. History pages continue
+into the archive once the hot table runs out.
+"""
+import json
+import zlib
+from datetime import datetime
+
+from django.db import transaction
+
+from .models import ConversationSummary, Message, MessageArchive
+
+
+def _pack(rows):
+    return zlib.compress(json.dumps(rows, separators=(',', ':')).encode(), 9)
+
+
+def _unpack(data):
+    return json.loads(zlib.decompress(bytes(data)))
+
+
+def _row(message):
+    return [message.id, message.sender_id, message.content, message.image.name or '', message.timestamp.isoformat()]
+
+
+def _message(conversation_id, row):
+    message_id, sender_id, content, image, timestamp = row
+    return Message(
+        id=message_id,
+        conversation_id=conversation_id,
+        sender_id=sender_id,
+        content=content,
+        image=image or None,
+        timestamp=datetime.fromisoformat(timestamp),
+    )
+
+
+def candidates(cutoff):
+    """Ids of conversations with messages older than ``cutoff``."""
+    return list(
+        Message.objects.filter(timestamp__lt=cutoff).order_by('conversation_id').values_list(
+            'conversation_id', flat=True
+        ).distinct()
+    )
+
+
+@transaction.atomic
+def archive_conversation(conversation_id, cutoff, limit=1000):
+    """
+    Move up to ``limit`` of the conversation's oldest archivable messages
+    into the archive; returns how many were moved. Each call commits on its
+    own, so an interrupted run resumes where it stopped.
+    """
+    read_by_all = min(
+        ConversationSummary.objects.filter(conversation_id=conversation_id).values_list(
+            'last_read_message_id', flat=True
+        ),
+        default=0,
+    )
+    newest_id = Message.objects.filter(conversation_id=conversation_id).order_by('-id').values_list(
+        'id', flat=True
+    ).first()
+    if newest_id is None:
+        return 0
+    messages = list(
+        Message.objects.filter(
+            conversation_id=conversation_id, timestamp__lt=cutoff, id__lte=read_by_all, id__lt=newest_id
+        ).order_by('id')[:limit]
+    )
+
+    by_month = {}
+    for message in messages:
+        by_month.setdefault(message.timestamp.date().replace(day=1), []).append(_row(message))
+    for month, rows in by_month.items():
+        archive = MessageArchive.objects.select_for_update().filter(
+            conversation_id=conversation_id, month=month
+        ).first()
+        if archive is None:
+            archive = MessageArchive(conversation_id=conversation_id, month=month)
+        else:
+            rows = sorted(_unpack(archive.data) + rows)
+        archive.data = _pack(rows)
+        archive.first_message_id = rows[0][0]
+        archive.last_message_id = rows[-1][0]
+        archive.message_count = len(rows)
+        archive.save()
+
+    Message.objects.filter(id__in=[message.id for message in messages]).delete()
+    return len(messages)
+
+
+def messages_before(conversation_id, before=None, limit=50):
+    """
+    Up to ``limit`` archived messages with ids below ``before``, newest
+    first, as unsaved ``Message`` instances.
+    """
+    archives = MessageArchive.objects.filter(conversation_id=conversation_id).order_by('-last_message_id')
+    if before:
+        archives = archives.filter(first_message_id__lt=before)
+    found = []
+    for archive in archives.iterator(chunk_size=2):
+        for row in reversed(_unpack(archive.data)):
+            if before and row[0] >= before:
+                continue
+            found.append(_message(conversation_id, row))
+            if len(found) == limit:
+                return found
+    return found
@@ -0,0 +1,137 @@
+"""
+WebSocket transport for chat rooms, mounted in ``u_connect/asgi.py``.
+
+A client connects to ``/ws/chat/<conversation_id>/`` with its session
+cookie and receives the events described in ``chat.events`` as JSON text
+frames. It may send ``{"type": "typing"}``; anything else is ignored.
+
+While the socket is open the user counts as online, and messages pushed
+to them are marked read, as the polling endpoint does for messages it
+returns. The polling endpoints stay in place for clients that cannot
+connect.
+"""
+import asyncio
+import json
+import re
+from types import SimpleNamespace
+from urllib.parse import urlparse
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.http.request import validate_host
+from django.utils.module_loading import import_string
+
+from . import events, presence, summaries
+from .layers import get_channel_layer
+from .models import Conversation
+
+PATH_RE = re.compile(r'^/ws/chat/(?P<conversation_id>\d+)/$')
+
+# Close codes in the 4000-4999 range are left to applications
+CLOSE_FORBIDDEN = 4403
+CLOSE_NOT_FOUND = 4404
+
+# How often an open socket renews the user's online flag
+PRESENCE_INTERVAL = presence.ONLINE_TIMEOUT / 2
+
+
+def _headers(scope):
+    return {name.decode('latin1').lower(): value.decode('latin1') for name, value in scope.get('headers', [])}
+
+
+def _origin_allowed(headers):
+    # Browsers always send Origin on WebSocket handshakes; checking it
+    # keeps other sites from opening sockets with our cookies.
+    origin = headers.get('origin')
+    if not origin:
+        return False
+    allowed_hosts = settings.ALLOWED_HOSTS
+    if settings.DEBUG and not allowed_hosts:
+        allowed_hosts = ['.localhost', '127.0.0.1', '[::1]']
+    return validate_host(urlparse(origin).hostname or '', allowed_hosts)
+
+
+@sync_to_async
+def _authenticate(headers, conversation_id):
+    cookies = {}
+    for chunk in headers.get('cookie', '').split(';'):
+        name, _, value = chunk.strip().partition('=')
+        cookies[name] = value
+    engine = import_string(f'{settings.SESSION_ENGINE}.SessionStore')
+    session = engine(cookies.get(settings.SESSION_COOKIE_NAME))
+    user = get_user(SimpleNamespace(session=session))
+    if not user.is_authenticated:
+        return None
+    if not Conversation.objects.filter(id=conversation_id, participants=user).exists():
+        return None
+    return user
+
+
+@sync_to_async
+def _mark_read(conversation_id, user_id, message_id):
+    last_read_id = summaries.mark_read(conversation_id, user_id, message_id)
+    if last_read_id is not None:
+        events.messages_read(conversation_id, user_id, last_read_id)
+
+
+async def chat_socket(scope, receive, send):
+    """ASGI application for ``websocket`` scopes."""
+    connect = await receive()
+    if connect['type'] != 'websocket.connect':
+        return
+
+    match = PATH_RE.match(scope['path'])
+    if match is None:
+        await send({'type': 'websocket.close', 'code': CLOSE_NOT_FOUND})
+        return
+    conversation_id = int(match['conversation_id'])
+    headers = _headers(scope)
+    user = await _authenticate(headers, conversation_id) if _origin_allowed(headers) else None
+    if user is None:
+        await send({'type': 'websocket.close', 'code': CLOSE_FORBIDDEN})
+        return
+
+    subscription = await get_channel_layer().subscribe(events.conversation_group(conversation_id))
+    await send({'type': 'websocket.accept'})
+
+    async def push():
+        while True:
+            event = await subscription.get()
+            if event.get('user_id') == user.id:
+                continue
+            if event['type'] == 'message' and event['message']['sender_id'] != user.id:
+                await _mark_read(conversation_id, user.id, event['message']['id'])
+                # Events can be shared between sockets; copy before changing
+                event = {**event, 'message': {**event['message'], 'status': 'read'}}
+            await send({'type': 'websocket.send', 'text': json.dumps(event)})
+
+    async def listen():
+        while True:
+            frame = await receive()
+            if frame['type'] == 'websocket.disconnect':
+                return
+            try:
+                data = json.loads(frame.get('text') or '{}')
+            except ValueError:
+                continue
+            if isinstance(data, dict) and data.get('type') == 'typing':
+                await sync_to_async(events.user_typing)(conversation_id, user.id)
+
+    async def stay_online():
+        while True:
+            if await sync_to_async(presence.heartbeat)(user.id):
+                await sync_to_async(events.presence_changed)(conversation_id, user.id, True)
+            await asyncio.sleep(PRESENCE_INTERVAL)
+
+    tasks = [asyncio.ensure_future(task()) for task in (listen, push, stay_online)]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await subscription.close()
+        # Another open tab puts the flag back on its next renewal
+        await sync_to_async(presence.go_offline)(user.id)
+        await sync_to_async(events.presence_changed)(conversation_id, user.id, False)
@@ -0,0 +1,69 @@
+"""
+Chat events pushed to the participants of a conversation.
+
+Every event is a JSON object with a ``type``:
+
+``message``   a new message, shaped like the entries of ``get_messages``
+``read``      ``user_id`` has read every message up to ``last_read_id``
+``typing``    ``user_id`` is typing
+``presence``  ``user_id`` came online or went offline (``is_online``)
+
+Publishing also bumps the conversation's version number in the presence
+store, which every process on the host shares, so long-polling requests
+handled by another worker than the publisher's notice the change within a
+second. Changes to a user's unread total bump their inbox version the same
+way (``chat.unread``).
+"""
+from . import presence
+from .layers import get_channel_layer
+
+
+def conversation_group(conversation_id):
+    return f'conversation-{conversation_id}'
+
+
+def version_key(conversation_id):
+    return f'version:{conversation_id}'
+
+
+def inbox_key(user_id):
+    return f'inbox:{user_id}'
+
+
+def get_versions(conversation_id, user_id):
+    """Return ``(conversation version, inbox version)``."""
+    return presence.counters(version_key(conversation_id), inbox_key(user_id))
+
+
+def serialize_message(message, status='sent'):
+    return {
+        'id': message.id,
+        'sender_id': message.sender_id,
+        'content': message.content,
+        'image_url': message.image.url if message.image else None,
+        'timestamp': message.timestamp.strftime("%I:%M %p"),
+        'status': status,
+    }
+
+
+def publish(conversation_id, event):
+    presence.bump(version_key(conversation_id))
+    get_channel_layer().publish(conversation_group(conversation_id), event)
+
+
+def message_created(message):
+    publish(message.conversation_id, {'type': 'message', 'message': serialize_message(message)})
+
+
+def messages_read(conversation_id, user_id, last_read_id):
+    publish(conversation_id, {'type': 'read', 'user_id': user_id, 'last_read_id': last_read_id})
+
+
+def user_typing(conversation_id, user_id):
+    # One event per refresh of the flag, not one per keystroke
+    if presence.set_typing(conversation_id, user_id):
+        publish(conversation_id, {'type': 'typing', 'user_id': user_id})
+
+
+def presence_changed(conversation_id, user_id, is_online):
+    publish(conversation_id, {'type': 'presence', 'user_id': user_id, 'is_online': is_online})
@@ -0,0 +1,130 @@
+"""
+Channel layers carry chat events from the process that produced them to the
+WebSocket connections subscribed to a conversation.
+
+``InMemoryChannelLayer`` only reaches sockets of the same process, which is
+all a single-node deployment needs. Deployments running several processes
+point ``CHAT_CHANNEL_LAYER`` at a shared layer::
+
+    CHAT_CHANNEL_LAYER = {
+        'BACKEND': 'chat.layers.RedisChannelLayer',
+        'OPTIONS': {'url': 'redis://localhost:6379/0'},
+    }
+
+``publish`` is synchronous so views and signal handlers can call it
+directly; subscriptions are consumed from the event loop.
+"""
+import asyncio
+import json
+import threading
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+DEFAULT_LAYER = {'BACKEND': 'chat.layers.InMemoryChannelLayer'}
+
+
+class BaseChannelLayer:
+    def publish(self, group, event):
+        raise NotImplementedError
+
+    async def subscribe(self, group):
+        """Return a subscription with ``async get()`` and ``async close()``."""
+        raise NotImplementedError
+
+
+class InMemorySubscription:
+    def __init__(self, layer, group):
+        self.layer = layer
+        self.group = group
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+
+    async def get(self):
+        return await self.queue.get()
+
+    async def close(self):
+        self.layer._discard(self)
+
+
+class InMemoryChannelLayer(BaseChannelLayer):
+    def __init__(self):
+        self._groups = {}
+        self._lock = threading.Lock()
+
+    def publish(self, group, event):
+        with self._lock:
+            subscriptions = list(self._groups.get(group, ()))
+        for subscription in subscriptions:
+            # Publishers run in worker threads; hand the event to the loop
+            subscription.loop.call_soon_threadsafe(subscription.queue.put_nowait, event)
+
+    async def subscribe(self, group):
+        subscription = InMemorySubscription(self, group)
+        with self._lock:
+            self._groups.setdefault(group, set()).add(subscription)
+        return subscription
+
+    def _discard(self, subscription):
+        with self._lock:
+            members = self._groups.get(subscription.group)
+            if members is not None:
+                members.discard(subscription)
+                if not members:
+                    del self._groups[subscription.group]
+
+
+class RedisSubscription:
+    def __init__(self, client, pubsub):
+        self.client = client
+        self.pubsub = pubsub
+
+    async def get(self):
+        async for message in self.pubsub.listen():
+            if message['type'] == 'message':
+                return json.loads(message['data'])
+
+    async def close(self):
+        await self.pubsub.aclose()
+        await self.client.aclose()
+
+
+class RedisChannelLayer(BaseChannelLayer):
+    """Redis pub/sub; needs the ``redis`` package."""
+
+    def __init__(self, url='redis://localhost:6379/0', prefix='chat'):
+        import redis
+
+        self.url = url
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+        self._errors = redis.RedisError
+
+    def publish(self, group, event):
+        try:
+            self._client.publish(f'{self.prefix}:{group}', json.dumps(event))
+        except self._errors:
+            # Polling clients still pick the change up from the database
+            pass
+
+    async def subscribe(self, group):
+        import redis.asyncio
+
+        client = redis.asyncio.Redis.from_url(self.url)
+        pubsub = client.pubsub()
+        await pubsub.subscribe(f'{self.prefix}:{group}')
+        return RedisSubscription(client, pubsub)
+
+
+_layer = None
+_layer_lock = threading.Lock()
+
+
+def get_channel_layer():
+    global _layer
+    if _layer is None:
+        with _layer_lock:
+            if _layer is None:
+                config = getattr(settings, 'CHAT_CHANNEL_LAYER', DEFAULT_LAYER)
+                _layer = import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+    return _layer
@@ -0,0 +1,31 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from chat import archive
+
+class Command(BaseCommand):
+    help = 'Moves old, read chat messages into the compressed monthly archive'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=getattr(settings, 'CHAT_ARCHIVE_AFTER_DAYS', 365),
+            help='Archive messages older than this many days',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000, help='Messages moved per transaction')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        batch_size = options['batch_size']
+        total = 0
+        for conversation_id in archive.candidates(cutoff):
+            while True:
+                moved = archive.archive_conversation(conversation_id, cutoff, limit=batch_size)
+                total += moved
+                if moved < batch_size:
+                    break
+            if options['verbosity'] > 1:
+                self.stdout.write(f'Conversation {conversation_id}: done')
+
+        self.stdout.write(self.style.SUCCESS(f'Archived {total} messages.'))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from chat import summaries
+
+class Command(BaseCommand):
+    help = 'Rebuilds the inbox summaries of every conversation from its messages'
+
+    def handle(self, *args, **options):
+        self.stdout.write('Rebuilding conversation summaries...')
+        with transaction.atomic():
+            total = summaries.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Successfully rebuilt {total} conversations.'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from chat import summaries, unread
+
+class Command(BaseCommand):
+    help = 'Recounts unread messages for every user and drops the cached totals'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            updated = summaries.recount_all()
+        self.stdout.write(self.style.SUCCESS(
+            f'Recounted {updated} conversation summaries. Cached totals elsewhere '
+            f'refresh within {unread.UNREAD_TIMEOUT} seconds.'
+        ))
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-17 10:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def populate_summaries(apps, schema_editor):
+    Conversation = apps.get_model('chat', 'Conversation')
+    ConversationSummary = apps.get_model('chat', 'ConversationSummary')
+    summaries = []
+    for conversation in Conversation.objects.prefetch_related('participants').iterator(chunk_size=500):
+        participant_ids = [user.id for user in conversation.participants.all()]
+        last_message = conversation.messages.order_by('-id').first()
+        for user_id in participant_ids:
+            summary = ConversationSummary(
+                user_id=user_id,
+                conversation_id=conversation.id,
+                other_user_id=next((other for other in participant_ids if other != user_id), None),
+                unread_count=conversation.messages.filter(is_read=False).exclude(sender_id=user_id).count(),
+                updated_at=conversation.updated_at or timezone.now(),
+            )
+            if last_message:
+                summary.last_message_text = last_message.content[:255]
+                summary.last_message_has_image = bool(last_message.image)
+                summary.last_message_sender_id = last_message.sender_id
+                summary.last_message_at = summary.updated_at = last_message.timestamp
+            summaries.append(summary)
+        if len(summaries) >= 1000:
+            ConversationSummary.objects.bulk_create(summaries)
+            summaries = []
+    ConversationSummary.objects.bulk_create(summaries)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0002_message_image'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConversationSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_message_text', models.CharField(blank=True, max_length=255)),
+                ('last_message_has_image', models.BooleanField(default=False)),
+                ('last_message_at', models.DateTimeField(blank=True, null=True)),
+                ('unread_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField()),
+                ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='summaries', to='chat.conversation')),
+                ('last_message_sender', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('other_user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversation_summaries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-updated_at'], name='chat_summary_inbox_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'conversation'), name='chat_summary_user_conversation')],
+            },
+        ),
+        migrations.RunPython(populate_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-17 10:22
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def populate_watermarks(apps, schema_editor):
+    Message = apps.get_model('chat', 'Message')
+    ConversationSummary = apps.get_model('chat', 'ConversationSummary')
+    # A participant has read up to the newest message they sent or saw
+    last_read = Message.objects.filter(
+        Q(sender_id=OuterRef('user_id')) | Q(is_read=True),
+        conversation_id=OuterRef('conversation_id'),
+    ).order_by('-id').values('id')[:1]
+    ConversationSummary.objects.update(last_read_message_id=Coalesce(Subquery(last_read), Value(0)))
+
+    unread = Message.objects.filter(
+        conversation_id=OuterRef('conversation_id'), id__gt=OuterRef('last_read_message_id')
+    ).exclude(sender_id=OuterRef('user_id')).order_by().values('conversation_id').annotate(
+        count=Count('id')
+    ).values('count')
+    ConversationSummary.objects.update(unread_count=Coalesce(Subquery(unread), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0003_conversationsummary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversationsummary',
+            name='last_read_message_id',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_watermarks, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='message',
+            name='is_read',
+        ),
+    ]
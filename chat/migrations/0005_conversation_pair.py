@@ -0,0 +1,87 @@
+# Generated by Django 5.2.18 on 2026-10-17 10:25
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def merge_duplicates(apps, schema_editor):
+    Conversation = apps.get_model('chat', 'Conversation')
+    ConversationSummary = apps.get_model('chat', 'ConversationSummary')
+    Message = apps.get_model('chat', 'Message')
+
+    participants = {}
+    for conversation_id, user_id in Conversation.participants.through.objects.values_list('conversation_id', 'user_id'):
+        participants.setdefault(conversation_id, set()).add(user_id)
+    pairs = {}
+    for conversation_id in sorted(participants):
+        user_ids = participants[conversation_id]
+        # A conversation whose partner deleted their account has one
+        # participant left; keying it (u, u) would merge all of u's orphaned
+        # threads, so it stays without a pair like group conversations
+        if len(user_ids) == 2:
+            pairs.setdefault((min(user_ids), max(user_ids)), []).append(conversation_id)
+
+    keys = []
+    for (low, high), conversation_ids in pairs.items():
+        keep, duplicates = conversation_ids[0], conversation_ids[1:]
+        keys.append(Conversation(id=keep, user_low_id=low, user_high_id=high))
+        if not duplicates:
+            continue
+        group = Conversation.objects.filter(id__in=conversation_ids)
+        updated_at = group.aggregate(latest=Max('updated_at'))['latest']
+        # Duplicates come from double clicks and hardly ever hold unread
+        # messages, so each participant keeps their furthest watermark
+        read = dict(
+            ConversationSummary.objects.filter(conversation_id__in=conversation_ids).values('user_id').annotate(
+                last_read=Max('last_read_message_id')
+            ).values_list('user_id', 'last_read')
+        )
+        Message.objects.filter(conversation_id__in=duplicates).update(conversation_id=keep)
+        Conversation.objects.filter(id__in=duplicates).delete()
+        Conversation.objects.filter(id=keep).update(updated_at=updated_at)
+
+        summaries = ConversationSummary.objects.filter(conversation_id=keep)
+        for user_id, last_read in read.items():
+            summaries.filter(user_id=user_id).update(last_read_message_id=last_read)
+        last_message = Message.objects.filter(conversation_id=keep).order_by('-id').first()
+        if last_message:
+            summaries.update(
+                last_message_text=last_message.content[:255],
+                last_message_has_image=bool(last_message.image),
+                last_message_sender_id=last_message.sender_id,
+                last_message_at=last_message.timestamp,
+                updated_at=last_message.timestamp,
+            )
+        unread = Message.objects.filter(
+            conversation_id=keep, id__gt=OuterRef('last_read_message_id')
+        ).exclude(sender_id=OuterRef('user_id')).order_by().values('conversation_id').annotate(
+            count=Count('id')
+        ).values('count')
+        summaries.update(unread_count=Coalesce(Subquery(unread), Value(0)))
+
+    Conversation.objects.bulk_update(keys, ['user_low', 'user_high'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0004_read_watermarks'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='user_high',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='user_low',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+    ]
@@ -1,23 +1,93 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 
 class Conversation(models.Model):
     participants = models.ManyToManyField(User, related_name='conversations')
+    # Canonical participant pair of a one-to-one chat, lower user id first,
+    # so each pair has exactly one conversation
+    user_low = models.ForeignKey(User, related_name='+', null=True, blank=True, on_delete=models.SET_NULL)
+    user_high = models.ForeignKey(User, related_name='+', null=True, blank=True, on_delete=models.SET_NULL)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-updated_at']
+        constraints = [
+            models.UniqueConstraint(fields=['user_low', 'user_high'], name='chat_conversation_pair'),
+        ]
 
     def __str__(self):
         return f"Conversation {self.id}"
 
+    @classmethod
+    def between(cls, user, other):
+        """Return the conversation of ``user`` and ``other``, creating it if needed."""
+        if user.id == other.id:
+            raise ValueError("A conversation needs two different users")
+        low, high = sorted([user.id, other.id])
+        # get_or_create retries the lookup when a concurrent request wins the
+        # insert; the outer transaction keeps the conversation invisible
+        # until its participants are in place
+        with transaction.atomic():
+            conversation, created = cls.objects.get_or_create(user_low_id=low, user_high_id=high)
+            if created:
+                conversation.participants.add(user, other)
+        return conversation
+
 class Message(models.Model):
     conversation = models.ForeignKey(Conversation, related_name='messages', on_delete=models.CASCADE)
     sender = models.ForeignKey(User, related_name='sent_messages', on_delete=models.CASCADE)
     content = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
-    is_read = models.BooleanField(default=False)
     image = models.ImageField(upload_to='chat_images/', blank=True, null=True)
 
     class Meta:
         ordering = ['timestamp']
+        indexes = [
+            # History pages are read backwards by id within a conversation
+            models.Index(fields=['conversation', 'id'], name='chat_message_history_idx'),
+        ]
+
+class MessageArchive(models.Model):
+    """One month of a conversation's archived messages, packed by chat.archive."""
+    conversation = models.ForeignKey(Conversation, related_name='archives', on_delete=models.CASCADE)
+    month = models.DateField()
+    first_message_id = models.PositiveBigIntegerField()
+    last_message_id = models.PositiveBigIntegerField()
+    message_count = models.PositiveIntegerField()
+    data = models.BinaryField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['conversation', 'month'], name='chat_archive_conversation_month'),
+        ]
+        indexes = [
+            models.Index(fields=['conversation', 'last_message_id'], name='chat_archive_history_idx'),
+        ]
+
+    def __str__(self):
+        return f"Conversation {self.conversation_id}, {self.month:%B %Y}"
+
+class ConversationSummary(models.Model):
+    """One participant's inbox row for a conversation, kept up to date by chat.summaries."""
+    user = models.ForeignKey(User, related_name='conversation_summaries', on_delete=models.CASCADE)
+    conversation = models.ForeignKey(Conversation, related_name='summaries', on_delete=models.CASCADE)
+    other_user = models.ForeignKey(User, related_name='+', null=True, blank=True, on_delete=models.SET_NULL)
+    last_message_text = models.CharField(max_length=255, blank=True)
+    last_message_has_image = models.BooleanField(default=False)
+    last_message_sender = models.ForeignKey(User, related_name='+', null=True, blank=True, on_delete=models.SET_NULL)
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    unread_count = models.PositiveIntegerField(default=0)
+    # Read watermark: every message up to this id counts as read by ``user``
+    last_read_message_id = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'conversation'], name='chat_summary_user_conversation'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-updated_at'], name='chat_summary_inbox_idx'),
+        ]
+
+    def __str__(self):
+        return f"Conversation {self.conversation_id} for {self.user}"
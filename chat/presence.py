@@ -0,0 +1,248 @@
+"""
+Who is online and who is typing, shared by every process on the host, plus
+the change counters chat long polls wait on (see ``chat.events``).
+
+Django's cache is per process here (no ``CACHES`` is configured), so flags
+set by one worker were invisible to the others. The flags live in a small
+SQLite file instead, each with an expiry time::
+
+    CHAT_PRESENCE_STORE = {
+        'BACKEND': 'chat.presence.SQLitePresenceStore',
+        'OPTIONS': {'path': '/run/u_connect/presence.sqlite3'},
+    }
+
+Deployments with a shared cache (Redis, Memcached) can use
+``chat.presence.CachePresenceStore`` instead.
+
+Heartbeats are coalesced: a process rewrites a flag only after a third of
+its lifetime has passed, so a tab polling every second costs a write every
+few seconds rather than one per request.
+"""
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+
+ONLINE_TIMEOUT = 10
+TYPING_TIMEOUT = 3
+
+DEFAULT_STORE = {'BACKEND': 'chat.presence.SQLitePresenceStore'}
+
+
+def online_key(user_id):
+    return f'online:{user_id}'
+
+
+def typing_key(conversation_id, user_id):
+    return f'typing:{conversation_id}:{user_id}'
+
+
+class BasePresenceStore:
+    def touch(self, key, timeout):
+        """Keep ``key`` alive for ``timeout`` seconds; True if it was not alive before."""
+        raise NotImplementedError
+
+    def alive(self, keys):
+        """Return the set of ``keys`` that are alive."""
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def increment(self, key):
+        """Add one to the counter ``key``."""
+        raise NotImplementedError
+
+    def counters(self, keys):
+        """Return {key: value} for ``keys``; counters never bumped read 0."""
+        raise NotImplementedError
+
+
+class SQLitePresenceStore(BasePresenceStore):
+    # Expired rows are swept at most this often (seconds)
+    PURGE_INTERVAL = 60
+
+    def __init__(self, path=None):
+        self.path = str(path or os.path.join(tempfile.gettempdir(), 'u_connect-presence.sqlite3'))
+        self._local = threading.local()
+        self._purged_at = 0
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            # The flags are rewritten by the next heartbeat; skip the fsyncs
+            connection.execute('PRAGMA synchronous=OFF')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS presence (key TEXT PRIMARY KEY, expires REAL NOT NULL) WITHOUT ROWID'
+            )
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS counters (key TEXT PRIMARY KEY, value INTEGER NOT NULL) WITHOUT ROWID'
+            )
+            self._local.connection = connection
+        return connection
+
+    def touch(self, key, timeout):
+        now = time.time()
+        connection = self._connection()
+        refreshed = connection.execute(
+            'UPDATE presence SET expires = ? WHERE key = ? AND expires > ?', (now + timeout, key, now)
+        ).rowcount
+        if not refreshed:
+            connection.execute('INSERT OR REPLACE INTO presence VALUES (?, ?)', (key, now + timeout))
+        if now - self._purged_at > self.PURGE_INTERVAL:
+            self._purged_at = now
+            connection.execute('DELETE FROM presence WHERE expires <= ?', (now,))
+        return not refreshed
+
+    def alive(self, keys):
+        keys = list(keys)
+        if not keys:
+            return set()
+        placeholders = ', '.join('?' * len(keys))
+        rows = self._connection().execute(
+            f'SELECT key FROM presence WHERE expires > ? AND key IN ({placeholders})', [time.time(), *keys]
+        )
+        return {key for key, in rows}
+
+    def delete(self, key):
+        self._connection().execute('DELETE FROM presence WHERE key = ?', (key,))
+
+    def increment(self, key):
+        self._connection().execute(
+            'INSERT INTO counters VALUES (?, 1) ON CONFLICT (key) DO UPDATE SET value = value + 1', (key,)
+        )
+
+    def counters(self, keys):
+        keys = list(keys)
+        placeholders = ', '.join('?' * len(keys))
+        rows = dict(self._connection().execute(
+            f'SELECT key, value FROM counters WHERE key IN ({placeholders})', keys
+        ))
+        return {key: rows.get(key, 0) for key in keys}
+
+
+class CachePresenceStore(BasePresenceStore):
+    """Django's cache; only shared between processes if the cache is."""
+
+    def __init__(self, prefix='presence'):
+        self.prefix = prefix
+
+    def touch(self, key, timeout):
+        key = f'{self.prefix}:{key}'
+        if cache.add(key, True, timeout):
+            return True
+        cache.set(key, True, timeout)
+        return False
+
+    def alive(self, keys):
+        keys = {f'{self.prefix}:{key}': key for key in keys}
+        return {keys[key] for key in cache.get_many(list(keys))}
+
+    def delete(self, key):
+        cache.delete(f'{self.prefix}:{key}')
+
+    def increment(self, key):
+        key = f'{self.prefix}:{key}'
+        cache.add(key, 0, None)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Evicted in between; waiters notice the reset value as a change
+            cache.set(key, 1, None)
+
+    def counters(self, keys):
+        prefixed = {f'{self.prefix}:{key}': key for key in keys}
+        found = cache.get_many(list(prefixed))
+        return {key: found.get(name, 0) for name, key in prefixed.items()}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                config = getattr(settings, 'CHAT_PRESENCE_STORE', DEFAULT_STORE)
+                _store = import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+    return _store
+
+
+# When this process last wrote each key (time.monotonic())
+_written = {}
+_written_lock = threading.Lock()
+
+
+def _touch(key, timeout):
+    """
+    Write ``key`` unless this process did so recently. Returns None when the
+    write was coalesced, otherwise whether the key was new.
+    """
+    now = time.monotonic()
+    with _written_lock:
+        if now - _written.get(key, float('-inf')) < timeout / 3:
+            return None
+        _written[key] = now
+        if len(_written) > 10000:
+            for stale in [k for k, written in _written.items() if now - written > ONLINE_TIMEOUT]:
+                del _written[stale]
+    return get_store().touch(key, timeout)
+
+
+def heartbeat(user_id):
+    """Mark ``user_id`` online; True if they were offline until now."""
+    return bool(_touch(online_key(user_id), ONLINE_TIMEOUT))
+
+
+def go_offline(user_id):
+    key = online_key(user_id)
+    with _written_lock:
+        _written.pop(key, None)
+    get_store().delete(key)
+
+
+def set_typing(conversation_id, user_id):
+    """Flag ``user_id`` as typing; False if the flag was refreshed moments ago."""
+    return _touch(typing_key(conversation_id, user_id), TYPING_TIMEOUT) is not None
+
+
+def online_users(user_ids):
+    """Return the subset of ``user_ids`` that are online, with one lookup."""
+    keys = {online_key(user_id): user_id for user_id in user_ids}
+    return {keys[key] for key in get_store().alive(keys)}
+
+
+def is_online(user_id):
+    return bool(online_users([user_id]))
+
+
+def is_typing(conversation_id, user_id):
+    return bool(get_store().alive([typing_key(conversation_id, user_id)]))
+
+
+def bump(*keys):
+    store = get_store()
+    for key in keys:
+        store.increment(key)
+
+
+def counters(*keys):
+    """Return the current values of the change counters ``keys``, in order."""
+    values = get_store().counters(keys)
+    return [values[key] for key in keys]
+
+
+def partner_state(conversation_id, user_id):
+    """Return ``(is_online, is_typing)`` for ``user_id`` with one lookup."""
+    online, typing = online_key(user_id), typing_key(conversation_id, user_id)
+    alive = get_store().alive([online, typing])
+    return online in alive, typing in alive
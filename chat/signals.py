@@ -0,0 +1,28 @@
+from django.db import transaction
+from django.db.models.signals import post_save, m2m_changed
+from django.dispatch import receiver
+from .models import Conversation, ConversationSummary, Message
+from . import events, summaries
+
+
+@receiver(post_save, sender=Message)
+def push_new_message(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: events.message_created(instance))
+
+@receiver(post_save, sender=Message)
+def update_summaries(sender, instance, created, **kwargs):
+    if created:
+        summaries.message_sent(instance)
+
+@receiver(m2m_changed, sender=Conversation.participants.through)
+def sync_participant_summaries(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        summaries.ensure_summaries(instance)
+    elif action == 'post_clear':
+        ConversationSummary.objects.filter(user=instance).delete()
+    else:
+        for conversation in Conversation.objects.filter(id__in=pk_set):
+            summaries.ensure_summaries(conversation)
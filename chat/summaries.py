@@ -0,0 +1,142 @@
+"""
+Maintenance of ``ConversationSummary``, the per-participant inbox rows.
+
+A row is created for every participant when they join a conversation.
+Sending a message refreshes the last-message snapshot of all rows of the
+conversation with a single UPDATE. Reading moves the reader's watermark,
+``last_read_message_id``, and recounts their unread messages in the same
+UPDATE; messages themselves are never written. ``rebuild`` recomputes
+everything from the messages.
+"""
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Conversation, ConversationSummary, Message
+from . import unread
+
+PREVIEW_LENGTH = 255
+
+
+def _snapshot(message):
+    return {
+        'last_message_text': message.content[:PREVIEW_LENGTH],
+        'last_message_has_image': bool(message.image),
+        'last_message_sender_id': message.sender_id,
+        'last_message_at': message.timestamp,
+        'updated_at': message.timestamp,
+    }
+
+
+def _unread_count(last_read=OuterRef('last_read_message_id')):
+    unread = Message.objects.filter(
+        conversation_id=OuterRef('conversation_id'), id__gt=last_read
+    ).exclude(sender_id=OuterRef('user_id')).order_by().values('conversation_id').annotate(
+        count=Count('id')
+    ).values('count')
+    return Coalesce(Subquery(unread), Value(0))
+
+
+def ensure_summaries(conversation):
+    """Create the missing rows of ``conversation`` and fix their other participant."""
+    participant_ids = list(conversation.participants.values_list('id', flat=True))
+    existing = dict(
+        ConversationSummary.objects.filter(conversation=conversation).values_list('user_id', 'other_user_id')
+    )
+    last_message = conversation.messages.order_by('-id').first()
+    snapshot = _snapshot(last_message) if last_message else {'updated_at': timezone.now()}
+
+    for user_id in participant_ids:
+        other_id = next((other for other in participant_ids if other != user_id), None)
+        if user_id not in existing:
+            ConversationSummary.objects.create(
+                user_id=user_id, conversation=conversation, other_user_id=other_id, **snapshot
+            )
+        elif existing[user_id] != other_id:
+            ConversationSummary.objects.filter(user_id=user_id, conversation=conversation).update(
+                other_user_id=other_id
+            )
+    ConversationSummary.objects.filter(conversation=conversation).exclude(user_id__in=participant_ids).delete()
+    refresh_unread(conversation.id)
+
+
+def message_sent(message):
+    summaries = ConversationSummary.objects.filter(conversation_id=message.conversation_id)
+    summaries.update(**_snapshot(message))
+    recipients = summaries.exclude(user_id=message.sender_id)
+    recipient_ids = list(recipients.values_list('user_id', flat=True))
+    recipients.update(unread_count=F('unread_count') + 1)
+    # Whoever replies has seen everything before their reply
+    summaries.filter(user_id=message.sender_id).update(last_read_message_id=message.id, unread_count=0)
+    transaction.on_commit(lambda: unread.message_received(recipient_ids))
+    transaction.on_commit(lambda: unread.invalidate([message.sender_id]))
+
+
+def mark_read(conversation_id, user_id, up_to_id=None):
+    """
+    Move ``user_id``'s watermark forward to ``up_to_id`` (default: the newest
+    message). Returns the new watermark, or None if it did not move.
+    """
+    if up_to_id is None:
+        up_to_id = Message.objects.filter(conversation_id=conversation_id).order_by('-id').values_list(
+            'id', flat=True
+        ).first()
+        if up_to_id is None:
+            return None
+    updated = ConversationSummary.objects.filter(
+        conversation_id=conversation_id, user_id=user_id, last_read_message_id__lt=up_to_id
+    ).update(last_read_message_id=up_to_id, unread_count=_unread_count(Value(up_to_id)))
+    if not updated:
+        return None
+    transaction.on_commit(lambda: unread.invalidate([user_id]))
+    return up_to_id
+
+
+def watermarks(conversation_id):
+    """Return {user_id: last read message id} for a conversation."""
+    return dict(
+        ConversationSummary.objects.filter(conversation_id=conversation_id).values_list(
+            'user_id', 'last_read_message_id'
+        )
+    )
+
+
+def refresh_unread(conversation_id):
+    """Recount unread messages of every participant from their watermarks."""
+    summaries = ConversationSummary.objects.filter(conversation_id=conversation_id)
+    user_ids = list(summaries.values_list('user_id', flat=True))
+    summaries.update(unread_count=_unread_count())
+    transaction.on_commit(lambda: unread.invalidate(user_ids))
+
+
+def recount_all():
+    """Recount every unread count from the messages; returns the rows updated."""
+    updated = ConversationSummary.objects.update(unread_count=_unread_count())
+    user_ids = ConversationSummary.objects.values_list('user_id', flat=True).distinct().iterator()
+    for chunk in _chunks(user_ids, 1000):
+        transaction.on_commit(lambda chunk=chunk: unread.invalidate(chunk))
+    return updated
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for value in iterable:
+        chunk.append(value)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def rebuild():
+    """Recreate every summary from scratch; returns the number of conversations."""
+    total = 0
+    for conversation in Conversation.objects.prefetch_related('participants').iterator(chunk_size=500):
+        ensure_summaries(conversation)
+        last_message = conversation.messages.order_by('-id').first()
+        if last_message:
+            ConversationSummary.objects.filter(conversation=conversation).update(**_snapshot(last_message))
+        total += 1
+    return total
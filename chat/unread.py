@@ -0,0 +1,59 @@
+"""
+Per-user count of unread chat messages for the navbar badge.
+
+The source of truth is the sum of the user's ``ConversationSummary`` unread
+counts; the cache holds that sum so the badge poll costs one cache read. A
+sent message increments the cached totals of its recipients and a read
+recount drops the cached totals of the conversation's participants, to be
+summed again on the next poll.
+
+Those updates only reach other processes through a shared cache, so a total
+is also summed again once it is ``CHAT_UNREAD_CACHE_TIMEOUT`` seconds old;
+that bounds how long a badge served by another worker can be wrong.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Sum
+
+from . import events, presence
+from .models import ConversationSummary
+
+UNREAD_KEY = 'chat:unread:{}'
+UNREAD_TIMEOUT = getattr(settings, 'CHAT_UNREAD_CACHE_TIMEOUT', 30)
+
+
+def total_unread(user_id):
+    key = UNREAD_KEY.format(user_id)
+    count = cache.get(key)
+    if count is None:
+        count = ConversationSummary.objects.filter(user_id=user_id).aggregate(
+            total=Sum('unread_count')
+        )['total'] or 0
+        cache.set(key, count, UNREAD_TIMEOUT)
+    return count
+
+
+def _changed(user_ids):
+    # Wakes the users' long polls in every process (chat.events)
+    presence.bump(*[events.inbox_key(user_id) for user_id in user_ids])
+
+
+def forget(user_id):
+    """Drop this process's cached total without telling the others."""
+    cache.delete(UNREAD_KEY.format(user_id))
+
+
+def message_received(user_ids):
+    _changed(user_ids)
+    for user_id in user_ids:
+        try:
+            # Keeps the entry's expiry, so the total is still re-summed in time
+            cache.incr(UNREAD_KEY.format(user_id))
+        except ValueError:
+            # Not cached; the next read sums it from the database
+            pass
+
+
+def invalidate(user_ids):
+    _changed(user_ids)
+    cache.delete_many([UNREAD_KEY.format(user_id) for user_id in user_ids])
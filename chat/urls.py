@@ -7,7 +7,11 @@ urlpatterns = [
     path('inbox/', views.inbox, name='inbox'),
     path('start/<int:user_id>/', views.start_chat, name='start_chat'),
     path('room/<int:conversation_id>/', views.chat_room, name='chat_room'),
-    path('room/<int:conversation_id>/messages/', views.get_messages, name='get_messages'),
+    path('room/<int:conversation_id>/sync/', views.sync, name='sync'),
+    # Older clients poll the sync payload under its previous name
+    path('room/<int:conversation_id>/messages/', views.sync, name='get_messages'),
+    path('room/<int:conversation_id>/messages/history/', views.message_history, name='message_history'),
+    path('room/<int:conversation_id>/messages/wait/', views.wait_for_messages, name='wait_for_messages'),
     path('room/<int:conversation_id>/typing/', views.update_typing_status, name='update_typing'),
     path('room/<int:conversation_id>/check_typing/', views.check_typing_status, name='check_typing'),
     path('total_unread/', views.get_total_unread, name='get_total_unread'),
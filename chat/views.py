@@ -1,32 +1,35 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.http import JsonResponse
-from django.core.cache import cache
-from .models import Conversation, Message
+from django.core.paginator import Paginator
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+from .models import Conversation, ConversationSummary, Message
 from .forms import MessageForm
+from . import archive, events, presence, summaries, unread
+from .layers import get_channel_layer
+
+LONG_POLL_TIMEOUT = getattr(settings, 'CHAT_LONG_POLL_TIMEOUT', 25)
+# How often a waiting request looks at the version in the cache
+LONG_POLL_CHECK_INTERVAL = 1
+# Messages per page of history; older pages are fetched by message id
+HISTORY_PAGE_SIZE = getattr(settings, 'CHAT_HISTORY_PAGE_SIZE', 50)
 
 @login_required
 def inbox(request):
-    conversations = Conversation.objects.filter(participants=request.user).order_by('-updated_at')
-    chats = []
-    seen_users = set()
-
-    for conv in conversations:
-        other_user = conv.participants.exclude(id=request.user.id).first()
-        if other_user:
-            if other_user.id in seen_users:
-                continue
-            seen_users.add(other_user.id)
-            
-            last_message = conv.messages.last()
-            unread_count = conv.messages.filter(is_read=False).exclude(sender=request.user).count()
-            chats.append({
-                'conversation': conv,
-                'other_user': other_user,
-                'last_message': last_message,
-                'unread_count': unread_count
-            })
+    summaries_qs = ConversationSummary.objects.filter(
+        user=request.user, other_user__isnull=False
+    ).select_related('other_user__profile').order_by('-updated_at')
+    paginator = Paginator(summaries_qs, 20)
+    chats = paginator.get_page(request.GET.get('page'))
+    online = presence.online_users([chat.other_user_id for chat in chats])
+    for chat in chats:
+        chat.other_online = chat.other_user_id in online
     return render(request, 'chat/inbox.html', {'chats': chats})
 
 @login_required
@@ -36,8 +39,9 @@ def chat_room(request, conversation_id):
         return redirect('chat:inbox')
     
     # Mark messages as read
-    unread_messages = conversation.messages.filter(is_read=False).exclude(sender=request.user)
-    unread_messages.update(is_read=True)
+    last_read_id = summaries.mark_read(conversation.id, request.user.id)
+    if last_read_id is not None:
+        events.messages_read(conversation.id, request.user.id, last_read_id)
 
     if request.method == 'POST':
         form = MessageForm(request.POST, request.FILES)
@@ -63,9 +67,11 @@ def chat_room(request, conversation_id):
     else:
         form = MessageForm()
     
+    messages, has_earlier = _history_page(conversation.id)
     return render(request, 'chat/chat_room.html', {
         'conversation': conversation,
-        'messages': conversation.messages.all(),
+        'messages': messages,
+        'has_earlier': has_earlier,
         'form': form,
         'other_user': conversation.participants.exclude(id=request.user.id).first()
     })
@@ -73,62 +79,82 @@ def chat_room(request, conversation_id):
 @login_required
 def start_chat(request, user_id):
     target_user = get_object_or_404(User, id=user_id)
-    conversation = Conversation.objects.filter(participants=request.user).filter(participants=target_user).first()
-    if not conversation:
-        conversation = Conversation.objects.create()
-        conversation.participants.add(request.user, target_user)
+    if target_user == request.user:
+        # Nobody to talk to; e.g. a seller opening the chat link on their own item
+        return redirect('chat:inbox')
+    conversation = Conversation.between(request.user, target_user)
     return redirect('chat:chat_room', conversation_id=conversation.id)
 
-@login_required
-def get_messages(request, conversation_id):
-    conversation = get_object_or_404(Conversation, id=conversation_id)
-    if request.user not in conversation.participants.all():
-        return JsonResponse({'error': 'Unauthorized'}, status=403)
-    
-    # Track user online status (expires in 10 seconds)
-    cache.set(f'user_online_{request.user.id}', True, 10)
-    
-    last_id = request.GET.get('last_id')
-    messages = conversation.messages.all()
+def _history_page(conversation_id, before=None):
+    """
+    The ``HISTORY_PAGE_SIZE`` messages before message id ``before`` (default:
+    the newest ones), oldest first, and whether earlier messages exist.
+    """
+    messages = Message.objects.filter(conversation_id=conversation_id).order_by('-id')
+    if before:
+        messages = messages.filter(id__lt=before)
+    page = list(messages[:HISTORY_PAGE_SIZE + 1])
+    if len(page) <= HISTORY_PAGE_SIZE:
+        # The hot table ran out; anything older is in the archive
+        oldest = page[-1].id if page else before
+        page += archive.messages_before(conversation_id, oldest, HISTORY_PAGE_SIZE + 1 - len(page))
+    return page[:HISTORY_PAGE_SIZE][::-1], len(page) > HISTORY_PAGE_SIZE
+
+def _participants(conversation_id, user):
+    """
+    Check that ``user`` takes part in the conversation and find their partner
+    with a single query. Returns ``(is_participant, other_user)``.
+    """
+    participants = list(User.objects.filter(conversations=conversation_id).select_related('profile'))
+    is_participant = any(participant.id == user.id for participant in participants)
+    other_user = next((participant for participant in participants if participant.id != user.id), None)
+    return is_participant, other_user
+
+def _message_data(msg, user, other_read, other_online):
+    # Determine status for new messages
+    status = 'read'
+    if msg.sender_id == user.id and msg.id > other_read:
+        status = 'delivered' if other_online else 'sent'
+
+    return {
+        'id': msg.id,
+        'sender_id': msg.sender_id,
+        'content': msg.content,
+        'image_url': msg.image.url if msg.image else None,
+        'timestamp': msg.timestamp.strftime("%I:%M %p"),
+        'is_sent': msg.sender_id == user.id,
+        'status': status
+    }
+
+def _conversation_updates(user, conversation_id, other_user, last_id, read_up_to=None):
+    """
+    Everything a chat tab polls for, in one payload: messages after
+    ``last_id`` (without it, the latest page of history), the partner's read
+    watermark, presence and typing state, and ``user``'s total unread count.
+    The watermark is left out when it still equals the ``read_up_to`` the
+    client already has.
+    """
+    presence.heartbeat(user.id)
     
     if last_id:
-        messages = messages.filter(id__gt=last_id)
-    
-    # Mark incoming messages as read
-    unread = messages.exclude(sender=request.user).filter(is_read=False)
-    unread.update(is_read=True)
+        messages = list(Message.objects.filter(conversation_id=conversation_id, id__gt=last_id).order_by('id'))
+    else:
+        messages, _ = _history_page(conversation_id)
     
-    # Check if other user is online
-    other_user = conversation.participants.exclude(id=request.user.id).first()
-    other_online = cache.get(f'user_online_{other_user.id}') if other_user else False
-
-    data = []
-    for msg in messages:
-        # Determine status for new messages
-        status = 'sent'
-        if msg.is_read:
-            status = 'read'
-        elif other_online:
-            status = 'delivered'
-
-        data.append({
-            'id': msg.id,
-            'sender_id': msg.sender.id,
-            'content': msg.content,
-            'image_url': msg.image.url if msg.image else None,
-            'timestamp': msg.timestamp.strftime("%I:%M %p"),
-            'is_sent': msg.sender == request.user,
-            'status': status
-        })
+    # Everything handed out here counts as read: move the watermark
+    if messages:
+        last_read_id = summaries.mark_read(conversation_id, user.id, messages[-1].id)
+        if last_read_id is not None:
+            events.messages_read(conversation_id, user.id, last_read_id)
     
-    # Get status updates for recent sent messages (to update ticks on client)
-    status_updates = []
-    recent_sent = conversation.messages.filter(sender=request.user).order_by('-id')[:30]
-    for msg in recent_sent:
-        s = 'sent'
-        if msg.is_read: s = 'read'
-        elif other_online: s = 'delivered'
-        status_updates.append({'id': msg.id, 'status': s})
+    # Presence and typing of the other user in one lookup
+    other_online = is_typing = False
+    other_read = 0
+    if other_user:
+        other_online, is_typing = presence.partner_state(conversation_id, other_user.id)
+        other_read = summaries.watermarks(conversation_id).get(other_user.id, 0)
+
+    data = [_message_data(msg, user, other_read, other_online) for msg in messages]
     
     # Partner info for header
     partner_info = {}
@@ -141,14 +167,108 @@ def get_messages(request, conversation_id):
                 partner_info['avatar'] = other_user.profile.image.url
         except Exception:
             pass
-            
-    return JsonResponse({'messages': data, 'statuses': status_updates, 'partner': partner_info})
+
+    updates = {
+        'messages': data,
+        'partner': partner_info,
+        'is_typing': is_typing,
+        'unread': unread.total_unread(user.id),
+    }
+    if str(other_read) != read_up_to:
+        updates['read_up_to'] = other_read
+    return updates
+
+@login_required
+def sync(request, conversation_id):
+    """
+    The single endpoint a chat tab polls: new messages, read watermark,
+    partner presence and typing, and the unread badge count.
+    """
+    is_participant, other_user = _participants(conversation_id, request.user)
+    if not is_participant:
+        return JsonResponse({'error': 'Unauthorized'}, status=403)
+    return JsonResponse(_conversation_updates(
+        request.user, conversation_id, other_user, request.GET.get('last_id'), request.GET.get('read_up_to')
+    ))
+
+@login_required
+def message_history(request, conversation_id):
+    """
+    A page of older messages: the ones before ``?before=<message id>``,
+    oldest first, with ``has_earlier`` telling whether to offer another page.
+    """
+    is_participant, other_user = _participants(conversation_id, request.user)
+    if not is_participant:
+        return JsonResponse({'error': 'Unauthorized'}, status=403)
+    try:
+        before = int(request.GET.get('before', ''))
+    except ValueError:
+        return JsonResponse({'error': 'before must be a message id'}, status=400)
+
+    messages, has_earlier = _history_page(conversation_id, before)
+    other_online = bool(other_user and presence.is_online(other_user.id))
+    other_read = summaries.watermarks(conversation_id).get(other_user.id, 0) if other_user else 0
+    return JsonResponse({
+        'messages': [_message_data(msg, request.user, other_read, other_online) for msg in messages],
+        'has_earlier': has_earlier,
+    })
+
+@login_required
+async def wait_for_messages(request, conversation_id):
+    """
+    Long-polling variant of ``sync``.
+
+    Answers as soon as the conversation's version differs from ``?version=``
+    (a message, read receipt or typing event), the user's unread count
+    differs from ``?unread=``, or after ``CHAT_LONG_POLL_TIMEOUT`` seconds,
+    with the same payload as ``sync`` plus the new ``version``.
+    """
+    user = await request.auser()
+    is_participant, other_user = await sync_to_async(_participants)(conversation_id, user)
+    if not is_participant:
+        return JsonResponse({'error': 'Unauthorized'}, status=403)
+
+    since = request.GET.get('version', '')
+    since_unread = request.GET.get('unread')
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + LONG_POLL_TIMEOUT
+    # Events from this process wake the request at once; the versions in the
+    # presence store catch the ones published by other processes
+    subscription = await get_channel_layer().subscribe(events.conversation_group(conversation_id))
+    try:
+        version, inbox = await sync_to_async(events.get_versions)(conversation_id, user.id)
+        # Messages in the user's other conversations move the badge
+        inbox_changed = bool(since_unread) and str(await sync_to_async(unread.total_unread)(user.id)) != since_unread
+        while str(version) == since and not inbox_changed:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            # Waiting counts as being online, like a regular poll
+            await sync_to_async(presence.heartbeat)(user.id)
+            try:
+                await asyncio.wait_for(subscription.get(), min(LONG_POLL_CHECK_INTERVAL, remaining))
+            except asyncio.TimeoutError:
+                pass
+            version, current_inbox = await sync_to_async(events.get_versions)(conversation_id, user.id)
+            inbox_changed = current_inbox != inbox
+    finally:
+        await subscription.close()
+
+    if inbox_changed:
+        # The change may have come from another process; recount here
+        await sync_to_async(unread.forget)(user.id)
+    data = await sync_to_async(_conversation_updates)(
+        user, conversation_id, other_user, request.GET.get('last_id'), request.GET.get('read_up_to')
+    )
+    data['version'] = version
+    return JsonResponse(data)
 
 @login_required
 def update_typing_status(request, conversation_id):
     if request.method == "POST":
-        key = f"typing_conversation_{conversation_id}_user_{request.user.id}"
-        cache.set(key, True, 3)
+        if not Conversation.objects.filter(id=conversation_id, participants=request.user).exists():
+            return JsonResponse({"status": "error"}, status=403)
+        events.user_typing(conversation_id, request.user.id)
         return JsonResponse({"status": "success"})
     return JsonResponse({"status": "error"}, status=400)
 
@@ -157,14 +277,16 @@ def check_typing_status(request, conversation_id):
     other_user_id = request.GET.get('other_user_id')
     
     if other_user_id:
-        key = f"typing_conversation_{conversation_id}_user_{other_user_id}"
-        is_typing = cache.get(key)
-        return JsonResponse({"is_typing": bool(is_typing)})
+        return JsonResponse({"is_typing": presence.is_typing(conversation_id, other_user_id)})
     
     return JsonResponse({"is_typing": False})
 
+def _unread_etag(request):
+    return f'unread-{unread.total_unread(request.user.id)}'
+
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_unread_etag)
 def get_total_unread(request):
-    # Count unread messages in all conversations for this user
-    count = Message.objects.filter(conversation__participants=request.user, is_read=False).exclude(sender=request.user).count()
-    return JsonResponse({'count': count})
+    # Maintained per-user total; unchanged values are answered with 304
+    return JsonResponse({'count': unread.total_unread(request.user.id)})